@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Compare memory, search latency and recall of the supported index settings
+on the documents currently in the store.
+
+Queries are the opening words of randomly sampled chunks. Recall@k is
+measured against exact fp32 search with the same metric; the cosine rows
+also report how much their top-k overlaps with the original L2 ranking.
+
+Example:
+    python benchmark_index.py --queries 200 --k 4
+"""
+import argparse
+import random
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from rag_pipeline import RAGPipeline, VECTOR_METRICS, VECTOR_STORAGE
+
+
+def recall_at_k(found: np.ndarray, expected: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(e)) for f, e in zip(found, expected))
+    return hits / expected.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark index metrics and vector storage")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rag = RAGPipeline()
+    if not rag.is_initialized():
+        print("⚠ No index found. Upload documents first.")
+        return False
+    documents = list(rag._ensure_index().documents)
+    contents = [doc["content"] for doc in documents]
+    random.seed(args.seed)
+    sample = random.sample(contents, min(args.queries, len(contents)))
+    queries = [" ".join(text.split()[:12]) for text in sample]
+
+    print(f"Encoding {len(contents)} chunks and {len(queries)} queries...")
+    raw_vectors = rag._embed(contents, {"metric": "l2"})
+    raw_queries = rag._embed(queries, {"metric": "l2"})
+
+    results = {}
+    for metric in VECTOR_METRICS:
+        vectors, query_vectors = raw_vectors.copy(), raw_queries.copy()
+        if metric == "cosine":
+            faiss.normalize_L2(vectors)
+            faiss.normalize_L2(query_vectors)
+
+        for storage in VECTOR_STORAGE:
+            index = rag._build_index(vectors, {"metric": metric, "storage": storage})
+            start = time.perf_counter()
+            _, ids = index.search(query_vectors, args.k)
+            elapsed = time.perf_counter() - start
+            results[(metric, storage)] = {
+                "ids": ids,
+                "bytes": faiss.serialize_index(index).nbytes,
+                "latency_ms": elapsed * 1000 / len(queries),
+            }
+
+    print(f"\n{'metric':<8}{'storage':<9}{'bytes/vec':>10}{'index MB':>10}"
+          f"{'ms/query':>10}{'recall@' + str(args.k):>11}{'vs l2':>8}")
+    baseline = results[("l2", "fp32")]["ids"]
+    for (metric, storage), result in results.items():
+        exact = results[(metric, "fp32")]["ids"]
+        print(f"{metric:<8}{storage:<9}"
+              f"{result['bytes'] / len(contents):>10.0f}"
+              f"{result['bytes'] / 1e6:>10.2f}"
+              f"{result['latency_ms']:>10.3f}"
+              f"{recall_at_k(result['ids'], exact):>11.3f}"
+              f"{recall_at_k(result['ids'], baseline):>8.3f}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
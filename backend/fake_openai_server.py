@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Minimal OpenAI-compatible chat completions server for local testing.
+
+Start it, then point the backend at it:
+    python fake_openai_server.py --port 8001 --delay 0.5
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://localhost:8001/v1 python main.py
+
+--delay makes every response slow (to exercise the latency budget and
+the extractive fallback). --error-rate fails a share of requests with
+HTTP 500 and --fail-first fails the first N requests (to exercise retries).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(delay: float, error_rate: float, fail_first: int = 0):
+    counter = {"requests": 0}
+    counter_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Completion requests received so far, shared by every handler instance
+        stats = counter
+
+        def _send(self, status: int, body: dict):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not self.path.endswith("/chat/completions"):
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            with counter_lock:
+                counter["requests"] += 1
+                request_number = counter["requests"]
+
+            time.sleep(delay)
+            if request_number <= fail_first or random.random() < error_rate:
+                self._send(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+                return
+
+            question = request["messages"][-1]["content"].split("Question:")[-1].split("\n")[0].strip()
+            self._send(200, {
+                "id": f"chatcmpl-fake-{int(time.time() * 1000)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"Fake answer to: {question}"},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N requests with HTTP 500")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(args.delay, args.error_rate, args.fail_first))
+    print(f"Fake OpenAI server listening on http://127.0.0.1:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
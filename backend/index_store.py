@@ -0,0 +1,654 @@
+import os
+import re
+import json
+import hashlib
+import mmap
+import time
+import threading
+from collections.abc import Sequence
+from contextlib import contextmanager
+from typing import Any, Callable, List, Dict, Optional
+
+import faiss
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Flat codes are only zero-copy mapped with IO_FLAG_MMAP_IFC (faiss >= 1.9);
+# older releases fall back to plain IO_FLAG_MMAP, which maps IVF lists only.
+FAISS_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "LOCK"
+REFERENCES_DIR = "references"
+# Settings assumed for manifests written before they were recorded
+DEFAULT_SETTINGS = {"metric": "l2", "storage": "fp32"}
+
+MANIFEST_PATTERN = re.compile(r"^MANIFEST-(\d+)\.json$")
+SEGMENT_PATTERN = re.compile(r"^seg-\d+[.-]")
+# Compaction output is named after the segments it merges, seg-<first>-<last>
+MERGED_SEGMENT_PATTERN = re.compile(r"^seg-\d+-(\d+)\.")
+ARTIFACT_PATTERN = re.compile(r"^([a-z_]+)-(\d+)\.json$")
+REFERENCE_PATTERN = re.compile(r"^(\d+)-[0-9a-f]+\.json$")
+
+
+class MappedDocuments(Sequence):
+    """Read-only chunk store backed by a memory-mapped JSON-lines file.
+
+    Records are decoded lazily on access, so every worker process shares the
+    same page-cache copy of the chunk text instead of holding its own list.
+    """
+
+    def __init__(self, data_path: str, offsets_path: str):
+        self._offsets = np.load(offsets_path, mmap_mode='r')
+        self._file = open(data_path, 'rb')
+        if os.path.getsize(data_path) > 0:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return json.loads(self._data[start:end])
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+class SegmentedDocuments(Sequence):
+    """Concatenated view over the chunk stores of several segments"""
+
+    def __init__(self, parts: List[Sequence]):
+        self._parts = parts
+        self._starts = np.cumsum([0] + [len(p) for p in parts])
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("chunk index out of range")
+        part = int(np.searchsorted(self._starts, idx, side='right')) - 1
+        return self._parts[part][idx - int(self._starts[part])]
+
+    def close(self):
+        for part in self._parts:
+            if isinstance(part, MappedDocuments):
+                part.close()
+
+
+class SegmentedIndex:
+    """Searches the FAISS index of every segment and merges the results.
+
+    Ids are global: segment offsets are added so they line up with the
+    matching SegmentedDocuments.
+    """
+
+    def __init__(self, indexes: List, documents: SegmentedDocuments, generation: int, settings: Dict,
+                 artifacts: Optional[Dict[str, Any]] = None, data_generation: Optional[int] = None):
+        self.indexes = indexes
+        self.documents = documents
+        self.generation = generation
+        # Generation that last changed the chunks; artifact and compaction commits keep it
+        self.data_generation = generation if data_generation is None else data_generation
+        self.settings = settings
+        # Derived data stored with this generation, e.g. topic clusters
+        self.artifacts = artifacts or {}
+        # Inner-product scores rank descending, L2 distances ascending
+        self.higher_is_better = settings["metric"] == "cosine"
+        self._starts = np.cumsum([0] + [idx.ntotal for idx in indexes])
+
+    @property
+    def ntotal(self) -> int:
+        return int(self._starts[-1])
+
+    def search(self, queries: np.ndarray, k: int):
+        n = queries.shape[0]
+        missing = -np.inf if self.higher_is_better else np.inf
+        if not self.indexes:
+            return (np.full((n, k), missing, dtype='float32'),
+                    np.full((n, k), -1, dtype='int64'))
+
+        all_distances, all_ids = [], []
+        for start, index in zip(self._starts, self.indexes):
+            distances, ids = index.search(queries, k)
+            all_distances.append(distances)
+            all_ids.append(np.where(ids >= 0, ids + start, -1))
+
+        distances = np.concatenate(all_distances, axis=1)
+        ids = np.concatenate(all_ids, axis=1)
+        # Missing results come back as -1 ids; push them to the end
+        distances = np.where(ids >= 0, distances, missing)
+        sort_keys = -distances if self.higher_is_better else distances
+        order = np.argsort(sort_keys, axis=1, kind='stable')[:, :k]
+        return (np.take_along_axis(distances, order, axis=1),
+                np.take_along_axis(ids, order, axis=1))
+
+    def reconstruct_ids(self, ids) -> np.ndarray:
+        """Stored vectors for the given global ids, in order"""
+        vectors = np.zeros((len(ids), self.indexes[0].d if self.indexes else 0), dtype='float32')
+        for row, idx in enumerate(ids):
+            segment = int(np.searchsorted(self._starts, idx, side='right')) - 1
+            vectors[row] = self.indexes[segment].reconstruct(int(idx - self._starts[segment]))
+        return vectors
+
+    def reconstruct_all(self) -> np.ndarray:
+        vectors = [index.reconstruct_n(0, index.ntotal) for index in self.indexes if index.ntotal]
+        if not vectors:
+            return np.zeros((0, 0), dtype='float32')
+        return np.vstack(vectors).astype('float32')
+
+    def close(self):
+        self.documents.close()
+
+
+def _lock_file(f):
+    """Block until this process holds an exclusive lock on the open file f"""
+    if fcntl:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    # msvcrt locks a byte range from the current position and gives up
+    # after about ten seconds, so keep retrying until the holder is done
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
+
+
+def _unlock_file(f):
+    if fcntl:
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _fsync_dir(path: str):
+    # Directory fsync makes renames durable; not supported on Windows
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def _atomic_write(path: str, mode: str = 'wb'):
+    """Write to a temp file, fsync it, then atomically rename into place"""
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_chunk_store(documents: Sequence, data_path: str, offsets_path: str):
+    """Write chunks as JSON lines plus an offsets array for random access"""
+    offsets = [0]
+    with _atomic_write(data_path) as f:
+        for doc in documents:
+            line = json.dumps(doc, ensure_ascii=False).encode('utf-8') + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+
+    with _atomic_write(offsets_path) as f:
+        np.save(f, np.array(offsets, dtype=np.int64))
+
+
+def write_faiss_index(index, path: str):
+    with _atomic_write(path) as f:
+        f.write(faiss.serialize_index(index).tobytes())
+
+
+def read_faiss_index(path: str, mmap_mode: bool = False):
+    if mmap_mode:
+        return faiss.read_index(path, FAISS_MMAP_FLAGS)
+    return faiss.read_index(path)
+
+
+class IndexStore:
+    """Versioned, append-only on-disk index.
+
+    Each upload writes an immutable segment (FAISS vectors + chunk store).
+    A manifest lists the live segments of one generation, and the CURRENT
+    file names the live manifest. Files are written to temp names, fsynced
+    and renamed, and CURRENT is swapped last, so a crash or a concurrent
+    reader only ever sees a complete generation.
+    """
+
+    def __init__(self, root: str, mmap_mode: bool = False):
+        self.root = root
+        self.mmap_mode = mmap_mode
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialise writers across threads and worker processes"""
+        with self._lock:
+            with open(self._path(LOCK_FILE), 'a+') as f:
+                _lock_file(f)
+                try:
+                    yield
+                finally:
+                    _unlock_file(f)
+
+    def current_generation(self) -> int:
+        """Cheap check used by workers to detect a new generation"""
+        try:
+            with open(self._path(CURRENT_FILE), 'r') as f:
+                match = MANIFEST_PATTERN.match(f.read().strip())
+        except OSError:
+            return 0
+        return int(match.group(1)) if match else 0
+
+    def read_manifest(self) -> Dict:
+        generation = self.current_generation()
+        if generation == 0:
+            return {"generation": 0, "data_generation": 0, "dimension": None, "settings": None, "segments": [],
+                    "next_segment": 1, "artifacts": {}}
+        return self._read_manifest_file(generation)
+
+    def _read_manifest_file(self, generation: int) -> Dict:
+        with open(self._path(f"MANIFEST-{generation:06d}.json"), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get("settings") is None and manifest["segments"]:
+            manifest["settings"] = dict(DEFAULT_SETTINGS)
+        manifest.setdefault("artifacts", {})
+        manifest.setdefault("data_generation", manifest["generation"])
+        return manifest
+
+    def _commit(self, manifest: Dict):
+        """Publish a new generation: manifest first, then swap CURRENT"""
+        manifest["generation"] += 1
+        manifest["created_at"] = time.time()
+        name = f"MANIFEST-{manifest['generation']:06d}.json"
+        with _atomic_write(self._path(name), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        with _atomic_write(self._path(CURRENT_FILE), 'w') as f:
+            f.write(name)
+        _fsync_dir(self.root)
+        return manifest
+
+    def _write_segment(self, segment_id: int, index, documents: Sequence, name: Optional[str] = None,
+                       source_vectors: Optional[np.ndarray] = None) -> Dict:
+        name = name or f"seg-{segment_id:06d}"
+        files = {
+            "vectors": f"{name}.faiss",
+            "chunks": f"{name}.jsonl",
+            "offsets": f"{name}.offsets.npy",
+        }
+        write_faiss_index(index, self._path(files["vectors"]))
+        write_chunk_store(documents, self._path(files["chunks"]), self._path(files["offsets"]))
+        if source_vectors is not None:
+            # Unquantised copy, only read when compacting; never loaded for search
+            files["source"] = f"{name}.source.npy"
+            with _atomic_write(self._path(files["source"])) as f:
+                np.save(f, np.ascontiguousarray(source_vectors, dtype='float32'))
+        return {
+            "id": segment_id,
+            "count": len(documents),
+            "files": files,
+            "sizes": {key: os.path.getsize(self._path(f)) for key, f in files.items()},
+        }
+
+    def append_segment(self, index, documents: Sequence, settings: Dict,
+                       expect_generation: Optional[int] = None,
+                       artifact_builders: Optional[Dict[str, Callable]] = None,
+                       source_vectors: Optional[np.ndarray] = None) -> Optional[Dict]:
+        """Add one segment and commit it as a new generation.
+
+        settings records the metric and vector storage the segment was built
+        with; every segment of a generation must share them. With
+        expect_generation, nothing is written (and None is returned) unless
+        the store is still at that generation. source_vectors keeps the
+        vectors of a quantised index exactly, so compaction can rebuild from
+        them instead of from the lossy codes.
+
+        artifact_builders maps a name to builder(segmented_index, previous),
+        called under the write lock with the new generation opened and the
+        previous generation's artifact of that name (or None), so builders
+        here should only do work proportional to the new segment. JSON
+        results are committed together with the segment; None drops the
+        artifact.
+        """
+        if index.ntotal != len(documents):
+            raise ValueError("Vector count does not match chunk count")
+        with self._write_lock():
+            manifest = self.read_manifest()
+            if expect_generation is not None and manifest["generation"] != expect_generation:
+                return None
+            if manifest["dimension"] not in (None, index.d):
+                raise ValueError(f"Embedding dimension {index.d} does not match index dimension {manifest['dimension']}")
+            if manifest["segments"] and manifest["settings"] != settings:
+                raise ValueError(f"Index settings {settings} do not match stored settings {manifest['settings']}; "
+                                 "run migrate_index.py to convert the index")
+            segment = self._write_segment(manifest["next_segment"], index, documents,
+                                          source_vectors=source_vectors)
+            _fsync_dir(self.root)
+            manifest["dimension"] = index.d
+            manifest["settings"] = settings
+            manifest["segments"].append(segment)
+            manifest["data_generation"] = manifest["generation"] + 1
+            manifest["next_segment"] += 1
+            if artifact_builders:
+                segmented = IndexStore(self.root, mmap_mode=True)._open_generation(manifest)
+                try:
+                    artifacts = {name: builder(segmented, segmented.artifacts.get(name))
+                                 for name, builder in artifact_builders.items()}
+                finally:
+                    segmented.close()
+                self._write_artifacts(manifest, artifacts)
+            manifest = self._commit(manifest)
+        self.collect_garbage()
+        return manifest
+
+    def add_artifacts(self, base_generation: int, builders: Dict[str, Callable]) -> Optional[Dict]:
+        """Build artifacts for data committed at base_generation, e.g. from a background task.
+
+        Builders run on a snapshot outside the write lock, so slow ones
+        don't hold up uploads; only the commit is locked. Compaction and
+        rewrites keep chunk ids, so the artifacts still apply if only those
+        happened since. If new chunks were appended, the store was cleared
+        or other artifacts changed, nothing is written and None is returned.
+        """
+        try:
+            base = self._read_manifest_file(base_generation)
+            segmented = IndexStore(self.root, mmap_mode=True)._open_generation(base)
+        except (OSError, ValueError):
+            return None  # the generation was already collected
+        if segmented is None:
+            return None
+        try:
+            artifacts = {name: builder(segmented, segmented.artifacts.get(name))
+                         for name, builder in builders.items()}
+        finally:
+            segmented.close()
+
+        def lineage(m):
+            others = {k: v for k, v in m["artifacts"].items() if k not in builders}
+            return m["data_generation"], m["settings"], others
+
+        with self._write_lock():
+            manifest = self.read_manifest()
+            if not manifest["segments"] or lineage(manifest) != lineage(base):
+                return None
+            self._write_artifacts(manifest, artifacts)
+            manifest = self._commit(manifest)
+        self.collect_garbage()
+        return manifest
+
+    def _write_artifacts(self, manifest: Dict, artifacts: Dict[str, Any]):
+        """Store built artifacts under the next generation; None drops one"""
+        for name, artifact in artifacts.items():
+            if artifact is None:
+                manifest["artifacts"].pop(name, None)
+                continue
+            filename = f"{name}-{manifest['generation'] + 1:06d}.json"
+            with _atomic_write(self._path(filename), 'w') as f:
+                json.dump(artifact, f)
+            manifest["artifacts"][name] = filename
+        _fsync_dir(self.root)
+
+    def _read_artifact(self, filename: Optional[str]):
+        if not filename:
+            return None
+        with open(self._path(filename), 'r') as f:
+            return json.load(f)
+
+    def _reference_path(self, data_generation: int, question: str) -> str:
+        digest = hashlib.sha1(question.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, REFERENCES_DIR, f"{data_generation:06d}-{digest}.json")
+
+    def read_reference(self, data_generation: int, question: str) -> Optional[Dict]:
+        """Reference answer another worker stored for a quiz question, if any.
+
+        References are keyed by the data generation rather than the
+        generation, so artifact commits and compaction keep them.
+        """
+        try:
+            with open(self._reference_path(data_generation, question), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_reference(self, data_generation: int, question: str, reference: Dict):
+        """Share a quiz reference answer with the other workers.
+
+        Each question has its own file, so no write lock is needed; racing
+        writers just replace it with an equivalent answer.
+        """
+        os.makedirs(self._path(REFERENCES_DIR), exist_ok=True)
+        with _atomic_write(self._reference_path(data_generation, question), 'w') as f:
+            json.dump(reference, f)
+
+    def clear(self) -> Dict:
+        with self._write_lock():
+            manifest = self.read_manifest()
+            manifest["dimension"] = None
+            manifest["settings"] = None
+            manifest["segments"] = []
+            manifest["artifacts"] = {}
+            manifest["data_generation"] = manifest["generation"] + 1
+            manifest = self._commit(manifest)
+        self.collect_garbage()
+        return manifest
+
+    def rewrite(self, index, documents: Sequence, settings: Dict,
+                source_vectors: Optional[np.ndarray] = None, vector_artifacts: Sequence[str] = ()) -> Dict:
+        """Replace every segment with a single one, e.g. after changing settings.
+
+        Chunk ids are kept, so artifacts carry over, except those named in
+        vector_artifacts: when the settings change they hold vectors of the
+        old space (e.g. topic centroids) and are dropped.
+        """
+        if index.ntotal != len(documents):
+            raise ValueError("Vector count does not match chunk count")
+        with self._write_lock():
+            manifest = self.read_manifest()
+            if manifest["settings"] != settings:
+                for name in vector_artifacts:
+                    manifest["artifacts"].pop(name, None)
+            segment = self._write_segment(manifest["next_segment"], index, documents,
+                                          source_vectors=source_vectors)
+            _fsync_dir(self.root)
+            manifest["dimension"] = index.d
+            manifest["settings"] = settings
+            manifest["segments"] = [segment]
+            manifest["next_segment"] += 1
+            manifest = self._commit(manifest)
+        self.collect_garbage()
+        return manifest
+
+    def load(self, retries: int = 3) -> Optional[SegmentedIndex]:
+        """Open the live generation, or None if the store is empty"""
+        for attempt in range(retries):
+            manifest = self.read_manifest()
+            try:
+                return self._open_generation(manifest)
+            except (OSError, ValueError):
+                # A newer generation may have been committed and the old
+                # files collected while we were opening them; try again.
+                if attempt == retries - 1 or self.current_generation() == manifest["generation"]:
+                    raise
+
+    def _open_generation(self, manifest: Dict) -> Optional[SegmentedIndex]:
+        if not manifest["segments"]:
+            return None
+
+        indexes, parts = [], []
+        try:
+            for segment in manifest["segments"]:
+                files = segment["files"]
+                for key, name in files.items():
+                    if os.path.getsize(self._path(name)) != segment["sizes"][key]:
+                        raise ValueError(f"Segment file {name} does not match the manifest")
+                index = read_faiss_index(self._path(files["vectors"]), mmap_mode=self.mmap_mode)
+                docs = MappedDocuments(self._path(files["chunks"]), self._path(files["offsets"]))
+                if not self.mmap_mode:
+                    mapped = docs
+                    docs = list(mapped)
+                    mapped.close()
+                if index.ntotal != len(docs) or index.ntotal != segment["count"]:
+                    raise ValueError(f"Segment {segment['id']} vectors and chunks are out of step")
+                indexes.append(index)
+                parts.append(docs)
+        except Exception:
+            for part in parts:
+                if isinstance(part, MappedDocuments):
+                    part.close()
+            raise
+
+        # Compaction and rewrites keep chunk order, so artifacts carry over as-is
+        artifacts = {name: self._read_artifact(filename) for name, filename in manifest["artifacts"].items()}
+        return SegmentedIndex(indexes, SegmentedDocuments(parts), manifest["generation"], manifest["settings"],
+                              artifacts, manifest.get("data_generation"))
+
+    def needs_compaction(self, max_segments: int) -> bool:
+        return len(self.read_manifest()["segments"]) > max_segments
+
+    def compact(self, index_factory) -> bool:
+        """Merge the live segments into one.
+
+        index_factory(vectors, settings) builds the merged FAISS index.
+        Segments that kept their source vectors are rebuilt from those, so
+        quantised vectors are encoded once rather than once per compaction;
+        the merged segment then keeps them too.
+
+        The merge is built and written outside the write lock from a
+        snapshot, under a name no upload can take; the lock is only held to
+        check the merged segments are still live and commit. Segments
+        appended meanwhile are kept.
+        """
+        snapshot = self.read_manifest()
+        if len(snapshot["segments"]) < 2:
+            return False
+
+        try:
+            segmented = IndexStore(self.root, mmap_mode=True)._open_generation(snapshot)
+        except (OSError, ValueError):
+            return False
+        segments = snapshot["segments"]
+        try:
+            vectors = np.vstack([
+                np.load(self._path(segment["files"]["source"])) if "source" in segment["files"]
+                else index.reconstruct_n(0, index.ntotal)
+                for segment, index in zip(segments, segmented.indexes)
+            ]).astype('float32')
+            documents = list(segmented.documents)
+        finally:
+            segmented.close()
+        keep_source = any("source" in segment["files"] for segment in segments)
+
+        # The merged segment takes over the last merged id; collection keeps
+        # its files while that segment is live, i.e. until this commits or loses
+        merged_ids = [s["id"] for s in snapshot["segments"]]
+        index = index_factory(vectors, snapshot["settings"])
+        segment = self._write_segment(merged_ids[-1], index, documents,
+                                      name=f"seg-{merged_ids[0]:06d}-{merged_ids[-1]:06d}",
+                                      source_vectors=vectors if keep_source else None)
+        _fsync_dir(self.root)
+
+        with self._write_lock():
+            manifest = self.read_manifest()
+            if [s["id"] for s in manifest["segments"][:len(merged_ids)]] != merged_ids:
+                # The store was cleared or compacted by someone else; the
+                # unused files are collected once the last merged id is gone
+                return False
+            manifest["segments"] = [segment] + manifest["segments"][len(merged_ids):]
+            self._commit(manifest)
+
+        self.collect_garbage()
+        print(f"✓ Compacted {len(merged_ids)} index segments into one")
+        return True
+
+    def collect_garbage(self, keep_manifests: int = 2):
+        """Remove segments and manifests no longer referenced by recent generations.
+
+        Workers that still map an unlinked file keep a valid view of it on
+        POSIX; on Windows the removal fails and is retried next time.
+        """
+        with self._write_lock():
+            generation = self.current_generation()
+            live_segments = set()
+            live_files = set()
+            live_manifests = set()
+            live_artifacts = set()
+            live_data = set()
+            live_generations = set(range(generation, max(0, generation - keep_manifests), -1))
+            for gen in live_generations:
+                name = f"MANIFEST-{gen:06d}.json"
+                try:
+                    with open(self._path(name), 'r') as f:
+                        manifest = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                live_manifests.add(name)
+                live_segments.update(s["id"] for s in manifest["segments"])
+                live_files.update(f for s in manifest["segments"] for f in s["files"].values())
+                live_artifacts.update(manifest.get("artifacts", {}).values())
+                live_data.add(manifest.get("data_generation", gen))
+
+            for name in os.listdir(self.root):
+                manifest_match = MANIFEST_PATTERN.match(name)
+                artifact_match = not manifest_match and ARTIFACT_PATTERN.match(name)
+                # A compaction may still be writing this merge outside the lock
+                merged_match = MERGED_SEGMENT_PATTERN.match(name)
+                if merged_match and int(merged_match.group(1)) in live_segments:
+                    continue
+                stale = (
+                    ".tmp-" in name
+                    or (manifest_match and name not in live_manifests)
+                    or (SEGMENT_PATTERN.match(name) and name not in live_files)
+                    or (artifact_match and name not in live_artifacts)
+                )
+                if stale:
+                    try:
+                        os.remove(self._path(name))
+                    except OSError:
+                        pass
+
+            # Reference answers are only reused for the chunks they were made from
+            references = self._path(REFERENCES_DIR)
+            if os.path.isdir(references):
+                for name in os.listdir(references):
+                    match = REFERENCE_PATTERN.match(name)
+                    if match and int(match.group(1)) not in live_data:
+                        try:
+                            os.remove(os.path.join(references, name))
+                        except OSError:
+                            pass
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+from typing import Callable, List, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+
+# Upstream failures worth another attempt within the latency budget
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter: `rate` requests/second, bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class LLMClient:
+    """Pooled, rate-limited chat completion client.
+
+    All requests run on one background event loop over a shared
+    AsyncOpenAI connection pool, so sync callers (`complete`) and async
+    callers (`acomplete`) share the same concurrency limit and rate
+    limiter. Every attempt has a per-request deadline, and if no answer
+    arrives within the overall latency budget the caller's fallback is
+    returned instead.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, model: str = "gpt-3.5-turbo",
+                 timeout: float = 10.0, latency_budget: float = 15.0, max_concurrency: int = 8,
+                 rate_limit: float = 3.0, burst: int = 5, max_retries: int = 2):
+        self.model = model
+        self.timeout = timeout
+        self.latency_budget = latency_budget
+        self.max_retries = max_retries
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True)
+        self._thread.start()
+
+        # Pool and limiters are created on the loop that will use them
+        asyncio.run_coroutine_threadsafe(
+            self._setup(api_key, base_url, max_concurrency, rate_limit, burst), self._loop).result()
+
+    async def _setup(self, api_key: str, base_url: Optional[str], max_concurrency: int,
+                     rate_limit: float, burst: int):
+        # Retries are handled here so they count against the latency budget
+        self._client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=max_concurrency,
+                                    max_keepalive_connections=max_concurrency),
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_limit, burst)
+
+    async def _request(self, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        self._client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                        ),
+                        self.timeout,
+                    )
+                return response.choices[0].message.content
+            except (asyncio.TimeoutError, *RETRYABLE_ERRORS):
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def _complete(self, messages: List[Dict], max_tokens: int, temperature: float,
+                        fallback: Callable[[], str]) -> str:
+        try:
+            return await asyncio.wait_for(self._request(messages, max_tokens, temperature), self.latency_budget)
+        except asyncio.TimeoutError:
+            print(f"LLM missed its {self.latency_budget}s latency budget. Falling back to extractive QA.")
+        except Exception as e:
+            print(f"OpenAI API error: {e}. Falling back to extractive QA.")
+        return fallback()
+
+    def complete(self, messages: List[Dict], fallback: Callable[[], str],
+                 max_tokens: int = 500, temperature: float = 0.7) -> str:
+        """Blocking completion for synchronous callers"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._complete(messages, max_tokens, temperature, fallback), self._loop)
+        return future.result()
+
+    async def acomplete(self, messages: List[Dict], fallback: Callable[[], str],
+                        max_tokens: int = 500, temperature: float = 0.7) -> str:
+        """Completion awaitable from any event loop"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._complete(messages, max_tokens, temperature, fallback), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def complete_many(self, requests: List[Dict], max_tokens: int = 500, temperature: float = 0.7) -> List[str]:
+        """Run several completions concurrently; each request holds `messages` and `fallback`"""
+        async def gather():
+            return await asyncio.gather(*[
+                self._complete(r["messages"], max_tokens, temperature, r["fallback"]) for r in requests
+            ])
+        return asyncio.run_coroutine_threadsafe(gather(), self._loop).result()
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
@@ -6,7 +7,7 @@ import uvicorn
 import os
 from pathlib import Path
 
-from rag_pipeline import RAGPipeline
+from rag_pipeline import RAGPipeline, TopicNotFoundError, SessionNotFoundError
 
 app = FastAPI(title="AI Placement Preparation Assistant")
 
@@ -32,16 +33,19 @@ class QueryRequest(BaseModel):
     mode: Optional[str] = "general"  # general, mock_interview, resume_review, company_specific, quiz, flashcard
     company: Optional[str] = None
     topic: Optional[str] = None
+    session_id: Optional[str] = None  # returned by a previous /query to continue the conversation
 
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[dict]
     mode: str
+    session_id: Optional[str] = None
 
 
 class QuizRequest(BaseModel):
     topic: Optional[str] = None
+    topic_id: Optional[int] = None  # id of a cluster from /topics
     difficulty: Optional[str] = "medium"  # easy, medium, hard
     num_questions: Optional[int] = 5
 
@@ -60,8 +64,18 @@ class AnswerCheckResponse(BaseModel):
     sources: List[dict]
 
 
+class BatchAnswerCheckRequest(BaseModel):
+    answers: List[AnswerCheckRequest]
+
+
+class BatchAnswerCheckResponse(BaseModel):
+    results: List[AnswerCheckResponse]
+    average_score: float
+
+
 class FlashcardRequest(BaseModel):
     topic: Optional[str] = None
+    topic_id: Optional[int] = None  # id of a cluster from /topics
     num_cards: Optional[int] = 10
 
 
@@ -119,22 +133,33 @@ async def upload_files(files: List[UploadFile] = File(...)):
 async def query_documents(request: QueryRequest):
     """Query the RAG system"""
     try:
-        if not rag.is_initialized():
+        if not await run_in_threadpool(rag.is_initialized):
             raise HTTPException(status_code=400, detail="No documents loaded. Please upload documents first.")
         
         # Get answer from RAG
-        result = rag.query(request.question, mode=request.mode)
+        result = await rag.aquery(request.question, mode=request.mode, session_id=request.session_id)
         
         return QueryResponse(
             answer=result["answer"],
             sources=result["sources"],
-            mode=request.mode
+            mode=request.mode,
+            session_id=result["session_id"]
         )
     
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
+@app.delete("/sessions/{session_id}")
+def end_session(session_id: str):
+    """Forget a conversation's history"""
+    if not rag.end_session(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"message": "Session ended"}
+
+
 @app.get("/documents")
 def list_documents():
     """List all uploaded documents"""
@@ -162,8 +187,25 @@ def clear_documents():
         raise HTTPException(status_code=500, detail=f"Error clearing documents: {str(e)}")
 
 
+@app.get("/topics")
+def list_topics():
+    """List topic clusters precomputed from the uploaded materials"""
+    try:
+        if not rag.is_initialized():
+            return {"count": 0, "topics": []}
+        
+        topics = rag.get_topics()
+        return {
+            "count": len(topics),
+            "topics": topics
+        }
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing topics: {str(e)}")
+
+
 @app.post("/quiz/generate")
-async def generate_quiz(request: QuizRequest):
+def generate_quiz(request: QuizRequest):
     """Generate quiz questions from uploaded materials"""
     try:
         if not rag.is_initialized():
@@ -172,7 +214,8 @@ async def generate_quiz(request: QuizRequest):
         questions = rag.generate_quiz_questions(
             topic=request.topic,
             difficulty=request.difficulty,
-            num_questions=request.num_questions
+            num_questions=request.num_questions,
+            topic_id=request.topic_id
         )
         
         return {
@@ -181,12 +224,14 @@ async def generate_quiz(request: QuizRequest):
             "difficulty": request.difficulty
         }
     
+    except TopicNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating quiz: {str(e)}")
 
 
 @app.post("/quiz/check", response_model=AnswerCheckResponse)
-async def check_answer(request: AnswerCheckRequest):
+def check_answer(request: AnswerCheckRequest):
     """Check user's answer against the knowledge base"""
     try:
         if not rag.is_initialized():
@@ -210,8 +255,26 @@ async def check_answer(request: AnswerCheckRequest):
         raise HTTPException(status_code=500, detail=f"Error checking answer: {str(e)}")
 
 
+@app.post("/quiz/check/batch", response_model=BatchAnswerCheckResponse)
+def check_answers_batch(request: BatchAnswerCheckRequest):
+    """Grade every answer of a quiz submission in one pass"""
+    try:
+        if not rag.is_initialized():
+            raise HTTPException(status_code=400, detail="No documents loaded. Please upload documents first.")
+        
+        results = rag.check_answers_batch([answer.model_dump() for answer in request.answers])
+        
+        return BatchAnswerCheckResponse(
+            results=[AnswerCheckResponse(**result) for result in results],
+            average_score=sum(r["score"] for r in results) / len(results) if results else 0.0
+        )
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error checking answers: {str(e)}")
+
+
 @app.post("/flashcards/generate")
-async def generate_flashcards(request: FlashcardRequest):
+def generate_flashcards(request: FlashcardRequest):
     """Generate flashcards from uploaded materials"""
     try:
         if not rag.is_initialized():
@@ -219,7 +282,8 @@ async def generate_flashcards(request: FlashcardRequest):
         
         flashcards = rag.generate_flashcards(
             topic=request.topic,
-            num_cards=request.num_cards
+            num_cards=request.num_cards,
+            topic_id=request.topic_id
         )
         
         return {
@@ -228,6 +292,8 @@ async def generate_flashcards(request: FlashcardRequest):
             "topic": request.topic
         }
     
+    except TopicNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating flashcards: {str(e)}")
 
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Convert the stored index to a new similarity metric and vector storage.
+Older faiss_index.bin / documents.pkl stores are imported first.
+
+Example:
+    python migrate_index.py --metric cosine --storage sq8
+"""
+import argparse
+import sys
+
+from rag_pipeline import RAGPipeline, VECTOR_METRICS, VECTOR_STORAGE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the FAISS index to new settings")
+    parser.add_argument("--metric", choices=VECTOR_METRICS, default="cosine")
+    parser.add_argument("--storage", choices=tuple(VECTOR_STORAGE), default="fp32")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Re-encode chunk text instead of reconstructing stored vectors")
+    args = parser.parse_args()
+
+    rag = RAGPipeline()
+    if not rag.is_initialized():
+        print("⚠ No index found. Nothing to migrate.")
+        return False
+
+    try:
+        rag.migrate_index(args.metric, args.storage, reembed=args.reembed)
+    except Exception as e:
+        print(f"✗ Migration failed: {e}")
+        return False
+
+    print(f"\nSet RAG_METRIC={args.metric} and RAG_VECTOR_STORAGE={args.storage} "
+          f"so new uploads use the same settings.")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -1,4 +1,5 @@
 import os
+import base64
 from typing import List, Dict, Optional
 from pypdf import PdfReader
 import faiss
@@ -7,30 +8,164 @@ import pickle
 import json
 from sentence_transformers import SentenceTransformer
 import re
-from openai import OpenAI
+import uuid
+import random
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from index_store import IndexStore, DEFAULT_SETTINGS
+from llm_client import LLMClient
+from session_store import SessionStore, SessionNotFoundError
 
 load_dotenv()
 
+VECTOR_METRICS = ("l2", "cosine")
+
+# Scalar quantiser types behind each non-fp32 storage option
+VECTOR_STORAGE = {
+    "fp32": None,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Cosine similarity between answer embeddings mapped onto a 0-100 score:
+# at or below the floor scores 0, at or above the ceiling scores 100.
+SIMILARITY_FLOOR = 0.2
+SIMILARITY_CEILING = 0.85
+
+# A question made only of these words has no subject of its own and leans on
+# the previous turn ("explain more", "give another example", "why?")
+FOLLOW_UP_WORDS = frozenset("""
+    more another again elaborate example examples detail details detailed further same else continue also
+    explain give show tell me us please can could you one some other what why how about and so then ok
+    okay is are was the a an of in on for with to do does go deeper expand clarify simpler simply
+""".split())
+# Pronouns that point back at the previous subject ("what are its advantages?")
+ANAPHORS = frozenset("it its this that these those they them their".split())
+# Questions this close to the previous one extend its candidate pool instead of a fresh search
+FOLLOW_UP_SIMILARITY = 0.6
+
+# Question wording used to sort mined quiz questions into difficulty decks
+EASY_QUESTION_PATTERN = re.compile(r"^\W*(\d+\s*[.)]?\s*)?(what is|what are|define|list|name|state|expand)\b", re.IGNORECASE)
+HARD_QUESTION_PATTERN = re.compile(
+    r"\b(differen\w*|compare|distinguish|explain|why|how|advantages?|disadvantages?|design|analy\w*|justify)\b",
+    re.IGNORECASE)
+DIFFICULTIES = ("easy", "medium", "hard")
+
+# Deck tiers of (chunk id, item index) references: mined quiz questions by
+# difficulty, "Explain:" prompts, and definition / other flashcards
+QUESTION_TIERS = DIFFICULTIES + ("explain",)
+FLASHCARD_TIERS = ("definition", "other")
+
+# Re-cluster topics in the background once the corpus has grown by this factor;
+# until then new chunks join the nearest existing cluster
+TOPIC_RECLUSTER_GROWTH = 1.5
+
+# Words too common in study material to name a topic cluster
+TOPIC_STOPWORDS = frozenset("""
+    the and for are with that this from what which when where how why who whom its into can has have
+    had been was were will would should could not but any all each more most other some such than then
+    them they their there these those use used using also may one two between about over under only very
+    does did doing done your you our out explain define definition difference give example examples
+    following question questions answer answers page unit part mark marks write list briefly discuss
+    describe state called known type types based different same many much well way like just here ans
+""".split())
+
+
+def _pack_refs(refs: np.ndarray) -> str:
+    """Encode (chunk id, item index) pairs compactly for a JSON artifact"""
+    return base64.b64encode(np.ascontiguousarray(refs, dtype='<i4').tobytes()).decode('ascii')
+
+
+def _unpack_refs(packed: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(packed), dtype='<i4').reshape(-1, 2)
+
+
+class TopicNotFoundError(LookupError):
+    """A topic_id that matches none of the current topic clusters"""
+
 
 class RAGPipeline:
     def __init__(self):
         self.model = None
         self.index = None
         self.documents = []
+        self.generation = 0
+        # Serialises hot-swaps; requests work on one snapshot of self.index
+        self._load_lock = threading.Lock()
+        
+        # Single-file store from earlier versions, migrated on first load
         self.index_path = "faiss_index.bin"
         self.docs_path = "documents.pkl"
         
+        # Share one read-only mapped copy of the index across worker processes
+        self.mmap_mode = os.getenv("RAG_MMAP_INDEX", "0").lower() in ("1", "true", "yes")
+        if self.mmap_mode:
+            print("✓ Memory-mapped index mode enabled")
+            if not hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+                print(f"⚠ faiss {faiss.__version__} can't map flat vector codes; each worker will hold "
+                      f"its own copy of the vectors. Upgrade to faiss-cpu>=1.9 to share them.")
+        
+        # Versioned segment store, compacted in the background
+        index_dir = os.getenv("RAG_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index"))
+        self.store = IndexStore(index_dir, mmap_mode=self.mmap_mode)
+        self.compact_segments = int(os.getenv("RAG_COMPACT_SEGMENTS", "8"))
+        self._compaction_thread = None
+        self._artifact_thread = None
+        # Index queued for the next topic and deck build while one is running
+        self._artifact_pending = None
+        self._artifact_building = False
+        self._artifact_lock = threading.Lock()
+        
+        # Topic clusters computed at ingest and stored with each index generation
+        self.max_topics = int(os.getenv("RAG_MAX_TOPICS", "12"))
+        
+        # Conversation sessions for follow-up questions
+        self.sessions = SessionStore(
+            max_sessions=int(os.getenv("RAG_MAX_SESSIONS", "2000")),
+            max_turns=int(os.getenv("RAG_SESSION_TURNS", "6"))
+        )
+        self.session_candidates = int(os.getenv("RAG_SESSION_CANDIDATES", "16"))
+        
+        # Reference answers per (data generation, question), generated once and shared with other workers
+        self.reference_answers = OrderedDict()
+        self.max_reference_answers = int(os.getenv("RAG_MAX_REFERENCE_ANSWERS", "2048"))
+        self._reference_lock = threading.Lock()
+        # Dealt quiz questions get their reference answers on one background thread
+        self._reference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reference-answers")
+        self._reference_pending = set()
+        
+        # Settings for new stores; an existing store keeps the ones it was built with
+        self.metric = os.getenv("RAG_METRIC", "l2").lower()
+        self.vector_storage = os.getenv("RAG_VECTOR_STORAGE", "fp32").lower()
+        if self.metric not in VECTOR_METRICS:
+            raise ValueError(f"RAG_METRIC must be one of {VECTOR_METRICS}, got {self.metric!r}")
+        if self.vector_storage not in VECTOR_STORAGE:
+            raise ValueError(f"RAG_VECTOR_STORAGE must be one of {tuple(VECTOR_STORAGE)}, got {self.vector_storage!r}")
+        
         # Initialize embedding model
         print("Initializing embedding model...")
         self.model = SentenceTransformer('all-MiniLM-L6-v2')
         print("✓ Embedding model loaded!")
         
         # Initialize OpenAI client if API key is available
-        self.openai_client = None
+        self.llm = None
         api_key = os.getenv("OPENAI_API_KEY")
         if api_key:
-            self.openai_client = OpenAI(api_key=api_key)
+            self.llm = LLMClient(
+                api_key=api_key,
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+                timeout=float(os.getenv("RAG_LLM_TIMEOUT", "10")),
+                latency_budget=float(os.getenv("RAG_LLM_LATENCY_BUDGET", "15")),
+                max_concurrency=int(os.getenv("RAG_LLM_MAX_CONCURRENCY", "8")),
+                rate_limit=float(os.getenv("RAG_LLM_RATE_LIMIT", "3")),
+                burst=int(os.getenv("RAG_LLM_BURST", "5")),
+                max_retries=int(os.getenv("RAG_LLM_MAX_RETRIES", "2"))
+            )
             print("✓ OpenAI client initialized!")
         else:
             print("⚠ No OpenAI API key found. Will use extractive QA.")
@@ -59,28 +194,59 @@ class RAGPipeline:
         
         return chunks
     
-    def _get_embedding(self, text: str) -> np.ndarray:
+    def _get_embedding(self, text: str, settings: Optional[Dict] = None) -> np.ndarray:
         """Get embedding for text using sentence-transformers"""
-        return self.model.encode(text, convert_to_numpy=True).astype('float32')
+        return self._embed([text], settings)[0]
+    
+    def _embed(self, texts: List[str], settings: Optional[Dict] = None, show_progress_bar: bool = False) -> np.ndarray:
+        """Embed texts as a float32 matrix, L2-normalised for cosine indexes"""
+        embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=show_progress_bar)
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        if (settings or self._index_settings())["metric"] == "cosine":
+            faiss.normalize_L2(embeddings)
+        return embeddings
+    
+    def _completion_messages(self, prompt: str, context: str, history: Optional[List[Dict]] = None) -> List[Dict]:
+        messages = [
+            {"role": "system", "content": "You are a helpful AI assistant for placement preparation. Answer questions based on the provided context."}
+        ]
+        for turn in history or []:
+            messages.append({"role": "user", "content": turn["question"]})
+            messages.append({"role": "assistant", "content": turn["answer"]})
+        messages.append(
+            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {prompt}\n\nProvide a clear and concise answer based on the context."}
+        )
+        return messages
     
-    def _get_completion(self, prompt: str, context: str, max_length: int = 500) -> str:
+    def _get_completion(self, prompt: str, context: str, max_length: int = 500,
+                        history: Optional[List[Dict]] = None) -> str:
         """Generate answer using OpenAI or extractive approach"""
-        if self.openai_client:
-            try:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "You are a helpful AI assistant for placement preparation. Answer questions based on the provided context."},
-                        {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {prompt}\n\nProvide a clear and concise answer based on the context."}
-                    ],
-                    max_tokens=max_length,
-                    temperature=0.7
-                )
-                return response.choices[0].message.content
-            except Exception as e:
-                print(f"OpenAI API error: {e}. Falling back to extractive QA.")
-        
-        # Fallback: Simple extractive QA
+        fallback = lambda: self._extractive_answer(prompt, context)
+        if self.llm:
+            return self.llm.complete(self._completion_messages(prompt, context, history), fallback,
+                                     max_tokens=max_length)
+        return fallback()
+    
+    async def _aget_completion(self, prompt: str, context: str, max_length: int = 500,
+                               history: Optional[List[Dict]] = None) -> str:
+        """Async variant of _get_completion that doesn't block the caller's event loop"""
+        fallback = lambda: self._extractive_answer(prompt, context)
+        if self.llm:
+            return await self.llm.acomplete(self._completion_messages(prompt, context, history), fallback,
+                                            max_tokens=max_length)
+        return fallback()
+    
+    def _get_completions(self, prompts: List[str], contexts: List[str], max_length: int = 500) -> List[str]:
+        """Generate several answers concurrently"""
+        if self.llm:
+            return self.llm.complete_many([{
+                "messages": self._completion_messages(prompt, context),
+                "fallback": lambda prompt=prompt, context=context: self._extractive_answer(prompt, context)
+            } for prompt, context in zip(prompts, contexts)], max_tokens=max_length)
+        return [self._extractive_answer(prompt, context) for prompt, context in zip(prompts, contexts)]
+    
+    def _extractive_answer(self, prompt: str, context: str) -> str:
+        """Fallback: Simple extractive QA"""
         sentences = [s.strip() for s in context.split('.') if len(s.strip()) > 20]
         question_words = set(re.findall(r'\w+', prompt.lower()))
         scored_sentences = []
@@ -119,60 +285,148 @@ class RAGPipeline:
                         "chunk": chunk_idx
                     })
         
-        # Add to existing documents or create new
-        self.documents.extend(new_docs)
+        if not new_docs:
+            return
         
-        # Create embeddings for all documents
-        all_contents = [doc["content"] for doc in self.documents]
-        embeddings = self.model.encode(all_contents, convert_to_numpy=True, show_progress_bar=True)
-        embeddings = embeddings.astype('float32')
+        # Migrate a single-file store before appending to it
+        if self.store.current_generation() == 0:
+            self._migrate_legacy_index()
         
-        # Create or update FAISS index
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings)
+        # New segments must match the metric and storage already on disk
+        settings = self.store.read_manifest()["settings"] or self._configured_settings()
         
-        print(f"✓ Indexed {len(self.documents)} document chunks")
+        # Only the new chunks are embedded; earlier segments are immutable
+        contents = [doc["content"] for doc in new_docs]
+        embeddings = self._embed(contents, settings, show_progress_bar=True)
         
-        # Save to disk
-        self._save_index()
+        # Save as a new segment and swap to the resulting generation
+        self.store.append_segment(self._build_index(embeddings, settings), new_docs, settings,
+                                  artifact_builders={"topics": self._assign_topics},
+                                  source_vectors=self._source_vectors(embeddings, settings))
+        index = self._ensure_index()
+        
+        print(f"✓ Indexed {len(index.documents)} document chunks")
+        
+        self._schedule_artifact_build(index)
+        self._schedule_compaction()
     
-    def _search(self, query: str, k: int = 4) -> List[Dict]:
+    def _search(self, index, query: str, k: int = 4) -> List[Dict]:
         """Search for relevant documents using FAISS vector similarity"""
-        if self.index is None or len(self.documents) == 0:
+        if len(index.documents) == 0:
             return []
         
         # Get query embedding
-        query_embedding = self._get_embedding(query)
+        query_embedding = self._get_embedding(query, index.settings)
         query_embedding = np.array([query_embedding])
         
         # Search FAISS index
-        distances, indices = self.index.search(query_embedding, k)
+        distances, indices = index.search(query_embedding, k)
         
         # Return relevant documents
         results = []
         for idx in indices[0]:
-            if idx < len(self.documents):
-                results.append(self.documents[idx])
+            if 0 <= idx < len(index.documents):
+                results.append(index.documents[idx])
         
         return results
     
-    def query(self, question: str, mode: str = "general") -> Dict:
+    def query(self, question: str, mode: str = "general", session_id: Optional[str] = None) -> Dict:
         """Query the RAG system"""
-        if self.index is None:
-            if not self._load_index():
-                raise Exception("No vector store available. Please upload documents first.")
+        session = self.sessions.get_or_create(session_id)
+        relevant_docs, context, prompt, history, subject = self._retrieve_context(question, session)
+        answer = self._get_completion(prompt, context, max_length=500, history=history)
+        session.add_turn(question, answer, prompt, subject)
+        return self._format_answer(answer, relevant_docs, session.id)
+    
+    async def aquery(self, question: str, mode: str = "general", session_id: Optional[str] = None) -> Dict:
+        """Query the RAG system without blocking the event loop on retrieval or the LLM"""
+        session = self.sessions.get_or_create(session_id)
+        # Embedding, FAISS search and a possible index reload are blocking calls
+        relevant_docs, context, prompt, history, subject = await run_in_threadpool(self._retrieve_context,
+                                                                                   question, session)
+        answer = await self._aget_completion(prompt, context, max_length=500, history=history)
+        session.add_turn(question, answer, prompt, subject)
+        return self._format_answer(answer, relevant_docs, session.id)
+    
+    def end_session(self, session_id: str) -> bool:
+        """Forget a conversation's history and retrieval state"""
+        return self.sessions.drop(session_id)
+    
+    def _retrieve_context(self, question: str, session):
+        index = self._ensure_index()
+        
+        history = session.history()
+        
+        # Rewrite questions without a subject of their own with the conversation's
+        # subject, so "explain more" and then "give another example" both keep it
+        subject = question
+        if history and self._needs_subject(question):
+            subject = history[-1]["subject"]
+        prompt = question if subject == question else f"{subject} {question}"
         
         # Get relevant documents
-        relevant_docs = self._search(question, k=4)
+        relevant_docs = self._session_search(index, prompt, session, follow_up=prompt != question, k=4)
         
         # Build context
         context = "\n\n".join([f"From {doc['source']} (page {doc['page']}):\n{doc['content']}" 
                                for doc in relevant_docs])
+        return relevant_docs, context, prompt, history, subject
+    
+    def _needs_subject(self, question: str) -> bool:
+        """Whether a question only makes sense with the previous turn's subject"""
+        words = re.findall(r"[a-z0-9][a-z0-9+#]*", question.lower())
+        content = [w for w in words if w not in FOLLOW_UP_WORDS and w not in ANAPHORS]
+        # "explain more", or a pronoun plus at most one word of its own ("what are its uses?")
+        return not content or (len(content) <= 1 and any(w in ANAPHORS for w in words))
+    
+    def _session_search(self, index, query: str, session, follow_up: bool, k: int = 4) -> List[Dict]:
+        """Search that keeps a per-session candidate pool for follow-up questions"""
+        if len(index.documents) == 0:
+            return []
         
-        # Generate answer using extractive approach
-        answer = self._get_completion(question, context, max_length=500)
+        # Candidate ids and vectors stay valid until chunks are added or removed or the
+        # vectors are rebuilt with other settings; topic, deck and compaction commits keep them
+        lineage = (index.data_generation, index.settings["metric"], index.settings["storage"])
+        if session.lineage != lineage:
+            session.clear_candidates()
         
+        cosine = index.settings["metric"] == "cosine"
+        query_vector = self._get_embedding(query, index.settings)
+        
+        # A question that names its own subject only reuses the pool when it stays on the same one
+        if not follow_up and session.query_vector is not None:
+            previous = session.query_vector.astype('float32')
+            norms = np.linalg.norm(query_vector) * np.linalg.norm(previous)
+            follow_up = norms > 0 and float(query_vector @ previous) / norms >= FOLLOW_UP_SIMILARITY
+        
+        if follow_up and len(session.candidate_ids):
+            # Extend the previous pool with a few fresh hits instead of a full search
+            _, indices = index.search(query_vector[None], k)
+            known = set(session.candidate_ids.tolist())
+            new_ids = np.array([i for i in indices[0] if i >= 0 and i not in known], dtype='int64')
+            ids = np.concatenate([session.candidate_ids, new_ids])
+            vectors = np.vstack([session.candidate_vectors.astype('float32'), index.reconstruct_ids(new_ids)])
+            
+            # Blend in the previous query to stay on the conversation's subject
+            target = 0.7 * query_vector + 0.3 * session.query_vector.astype('float32')
+            if cosine:
+                target /= np.linalg.norm(target) or 1.0
+        else:
+            _, indices = index.search(query_vector[None], max(k, self.session_candidates))
+            ids = indices[0][indices[0] >= 0]
+            vectors = index.reconstruct_ids(ids)
+            target = query_vector
+        
+        if cosine:
+            scores = vectors @ target
+        else:
+            scores = -np.sum((vectors - target) ** 2, axis=1)
+        order = np.argsort(-scores, kind='stable')[:self.session_candidates]
+        session.set_candidates(lineage, ids[order], vectors[order], target)
+        
+        return [index.documents[int(idx)] for idx in ids[order[:k]]]
+    
+    def _format_answer(self, answer: str, relevant_docs: List[Dict], session_id: Optional[str] = None) -> Dict:
         # Format sources
         sources = []
         for doc in relevant_docs:
@@ -184,18 +438,34 @@ class RAGPipeline:
         
         return {
             "answer": answer,
-            "sources": sources
+            "sources": sources,
+            "session_id": session_id
         }
     
-    def generate_quiz_questions(self, topic: Optional[str] = None, difficulty: str = "medium", num_questions: int = 5) -> List[Dict]:
+    def generate_quiz_questions(self, topic: Optional[str] = None, difficulty: str = "medium", num_questions: int = 5,
+                                topic_id: Optional[int] = None) -> List[Dict]:
         """Generate quiz questions from the knowledge base"""
-        if self.index is None:
-            if not self._load_index():
-                raise Exception("No vector store available. Please upload documents first.")
+        index = self._ensure_index()
         
-        # Search for relevant content
-        search_query = topic if topic else "interview questions concepts"
-        relevant_docs = self._search(search_query, k=6)
+        # Serve from the pre-warmed deck when one covers this topic
+        found, cluster_id, topic_name = self._find_deck(index, topic, topic_id)
+        if found:
+            # Matching mined questions first, other mined questions, then "Explain:" prompts
+            difficulty_tier = difficulty if difficulty in DIFFICULTIES else "medium"
+            tiers = [[difficulty_tier], [d for d in DIFFICULTIES if d != difficulty_tier], ["explain"]]
+            questions = [{
+                "id": i + 1,
+                "question": item["question"],
+                "difficulty": difficulty,
+                "topic": topic_name
+            } for i, item in enumerate(self._deal(index, tiers, "questions", cluster_id, num_questions))]
+            # Reference answers are made while the user answers, so dealing stays O(count)
+            self._queue_reference_answers(index, [q["question"] for q in questions])
+            return questions
+        
+        # Take content from a precomputed topic cluster, or search for it
+        relevant_docs, topic_name = self._topic_documents(index, topic, topic_id, k=6,
+                                                          default_query="interview questions concepts")
         
         context = "\n\n".join([doc["content"] for doc in relevant_docs])
         
@@ -218,7 +488,7 @@ class RAGPipeline:
                     "id": len(questions) + 1,
                     "question": line,
                     "difficulty": difficulty,
-                    "topic": topic or "General"
+                    "topic": topic_name
                 })
                 if len(questions) >= num_questions:
                     break
@@ -233,10 +503,15 @@ class RAGPipeline:
                     "id": len(questions) + 1,
                     "question": q_text,
                     "difficulty": difficulty,
-                    "topic": topic or "General"
+                    "topic": topic_name
                 })
         
-        return questions[:num_questions]
+        questions = questions[:num_questions]
+        
+        # Generate reference answers now so grading doesn't have to
+        self._reference_answers(index, [q["question"] for q in questions])
+        
+        return questions
         
         # Parse questions
         questions = []
@@ -250,7 +525,7 @@ class RAGPipeline:
                         "id": len(questions) + 1,
                         "question": question_text,
                         "difficulty": difficulty,
-                        "topic": topic or "General"
+                        "topic": topic_name
                     })
                     break
         
@@ -258,59 +533,143 @@ class RAGPipeline:
     
     def check_answer(self, question: str, user_answer: str, topic: Optional[str] = None) -> Dict:
         """Check user's answer against the knowledge base"""
-        if self.index is None:
-            if not self._load_index():
-                raise Exception("No vector store available. Please upload documents first.")
+        return self.check_answers_batch([{
+            "question": question,
+            "user_answer": user_answer,
+            "topic": topic
+        }])[0]
+    
+    def check_answers_batch(self, answers: List[Dict]) -> List[Dict]:
+        """Grade a whole quiz submission in one pass"""
+        index = self._ensure_index()
+        if not answers:
+            return []
         
-        # Get correct answer from knowledge base
-        relevant_docs = self._search(question, k=3)
-        context = "\n\n".join([doc["content"] for doc in relevant_docs])
+        references = self._reference_answers(index, [a["question"] for a in answers])
         
-        # Get expected answer
-        correct_answer = self._get_completion(question, context, max_length=300)
+        # Embed user and reference answers together and score all pairs at once
+        user_answers = [a["user_answer"] for a in answers]
+        correct_answers = [ref["answer"] for ref in references]
+        embeddings = self._embed(user_answers + correct_answers, {"metric": "cosine"})
+        user_vectors, correct_vectors = embeddings[:len(answers)], embeddings[len(answers):]
+        similarities = np.einsum('ij,ij->i', user_vectors, correct_vectors)
+        scores = np.clip((similarities - SIMILARITY_FLOOR) / (SIMILARITY_CEILING - SIMILARITY_FLOOR), 0, 1) * 100
         
-        # Simple keyword-based evaluation
-        user_words = set(re.findall(r'\w+', user_answer.lower()))
-        correct_words = set(re.findall(r'\w+', correct_answer.lower()))
+        results = []
+        for user_answer, reference, score in zip(user_answers, references, scores):
+            score = int(round(score)) if user_answer.strip() else 0
+            results.append({
+                "is_correct": score >= 70,
+                "score": score,
+                "feedback": self._grade_feedback(score),
+                "correct_answer": reference["answer"],
+                "sources": reference["sources"][:2]
+            })
+        return results
+    
+    def _reference_answers(self, index, questions: List[str]) -> List[Dict]:
+        """Return reference answers for an index generation, generating the missing ones in one batch.
         
-        # Calculate overlap
-        overlap = len(user_words & correct_words)
-        total_correct = len(correct_words)
+        Answers are shared through the index store, so the worker grading a
+        quiz reuses the ones made by the worker that generated it. They are
+        keyed by the data generation: topic, deck and compaction commits
+        keep them, while an upload or reset never grades against answers
+        built from other chunks.
+        """
+        generation = index.data_generation
+        unique = list(dict.fromkeys(questions))
+        with self._reference_lock:
+            cached = {q: self.reference_answers[(generation, q)] for q in unique
+                      if (generation, q) in self.reference_answers}
+            for q in cached:
+                self.reference_answers.move_to_end((generation, q))
         
-        if total_correct > 0:
-            score = min(100, int((overlap / total_correct) * 100))
-        else:
-            score = 50
+        found = {}
+        for q in unique:
+            if q not in cached:
+                reference = self.store.read_reference(generation, q)
+                if reference is not None:
+                    found[q] = reference
         
-        is_correct = score >= 70
+        missing = [q for q in unique if q not in cached and q not in found]
+        if missing:
+            # One encode call and one index search for every uncached question
+            query_embeddings = self._embed(missing, index.settings)
+            _, indices = index.search(query_embeddings, 3)
         
-        # Generate feedback
+            all_ids = [[int(idx) for idx in row if 0 <= idx < len(index.documents)] for row in indices]
+            contexts = ["\n\n".join([index.documents[idx]["content"] for idx in ids]) for ids in all_ids]
+            answers = self._get_completions(missing, contexts, max_length=300)
+        
+            for question, answer, source_ids in zip(missing, answers, all_ids):
+                found[question] = {"answer": answer, "source_ids": source_ids}
+                try:
+                    self.store.write_reference(generation, question, found[question])
+                except OSError as e:
+                    print(f"Error saving reference answer: {e}")
+        
+        if found:
+            cached.update(found)
+            with self._reference_lock:
+                for question, reference in found.items():
+                    self.reference_answers[(generation, question)] = reference
+                while len(self.reference_answers) > self.max_reference_answers:
+                    self.reference_answers.popitem(last=False)
+        
+        return [{
+            "answer": cached[q]["answer"],
+            "sources": [index.documents[idx] for idx in cached[q]["source_ids"] if idx < len(index.documents)]
+        } for q in questions]
+    
+    def _queue_reference_answers(self, index, questions: List[str]):
+        """Generate reference answers in the background, so grading usually finds them ready"""
+        with self._reference_lock:
+            keys = [(index.data_generation, q) for q in dict.fromkeys(questions)]
+            keys = [key for key in keys if key not in self.reference_answers and key not in self._reference_pending]
+            self._reference_pending.update(keys)
+        if not keys:
+            return
+        
+        def generate():
+            try:
+                self._reference_answers(index, [q for _, q in keys])
+            except Exception as e:
+                print(f"Error generating reference answers: {e}")
+            finally:
+                with self._reference_lock:
+                    self._reference_pending.difference_update(keys)
+        
+        self._reference_executor.submit(generate)
+    
+    def _grade_feedback(self, score: int) -> str:
+        """Feedback text for an answer score"""
         if score >= 85:
-            evaluation_text = f"Score: {score}/100\n\nExcellent answer! You covered the key concepts well.\n\nYour answer demonstrates good understanding of the topic."
+            return f"Score: {score}/100\n\nExcellent answer! You covered the key concepts well.\n\nYour answer demonstrates good understanding of the topic."
         elif score >= 70:
-            evaluation_text = f"Score: {score}/100\n\nGood answer! You got most of the important points.\n\nConsider adding more details about the concepts covered in the study material."
+            return f"Score: {score}/100\n\nGood answer! You got most of the important points.\n\nConsider adding more details about the concepts covered in the study material."
         elif score >= 50:
-            evaluation_text = f"Score: {score}/100\n\nPartial credit. Your answer touches on some relevant points.\n\nReview the study material for more complete information. Key areas to focus on: the main concepts and definitions."
+            return f"Score: {score}/100\n\nPartial credit. Your answer touches on some relevant points.\n\nReview the study material for more complete information. Key areas to focus on: the main concepts and definitions."
         else:
-            evaluation_text = f"Score: {score}/100\n\nNeeds improvement. Your answer doesn't match the expected response well.\n\nPlease review the study material carefully and try to include the key terms and concepts."
-        
-        return {
-            "is_correct": is_correct,
-            "score": score,
-            "feedback": evaluation_text,
-            "correct_answer": correct_answer,
-            "sources": relevant_docs[:2]
-        }
+            return f"Score: {score}/100\n\nNeeds improvement. Your answer doesn't match the expected response well.\n\nPlease review the study material carefully and try to include the key terms and concepts."
     
-    def generate_flashcards(self, topic: Optional[str] = None, num_cards: int = 10) -> List[Dict]:
+    def generate_flashcards(self, topic: Optional[str] = None, num_cards: int = 10,
+                            topic_id: Optional[int] = None) -> List[Dict]:
         """Generate flashcards from the knowledge base"""
-        if self.index is None:
-            if not self._load_index():
-                raise Exception("No vector store available. Please upload documents first.")
+        index = self._ensure_index()
+        
+        # Serve from the pre-warmed deck when one covers this topic
+        found, cluster_id, topic_name = self._find_deck(index, topic, topic_id)
+        if found:
+            return [{
+                "id": i + 1,
+                "front": card["front"],
+                "back": card["back"],
+                "topic": topic_name
+            } for i, card in enumerate(self._deal(index, [["definition"], ["other"]], "flashcards", cluster_id, num_cards))]
         
-        # Search for relevant content
-        search_query = topic if topic else "key concepts definitions"
-        relevant_docs = self._search(search_query, k=8)
+        # Take content from a precomputed topic cluster, or search for it
+        relevant_docs, topic_name = self._topic_documents(index, topic, topic_id, k=8,
+                                                          default_query="key concepts definitions")
         
         context = "\n\n".join([doc["content"] for doc in relevant_docs])
         
@@ -331,7 +690,7 @@ class RAGPipeline:
                         "id": len(flashcards) + 1,
                         "front": front,
                         "back": back,
-                        "topic": topic or "General"
+                        "topic": topic_name
                     })
                     if len(flashcards) >= num_cards:
                         break
@@ -351,52 +710,493 @@ class RAGPipeline:
                         "id": len(flashcards) + 1,
                         "front": front,
                         "back": back,
-                        "topic": topic or "General"
+                        "topic": topic_name
                     })
         
         return flashcards[:num_cards]
     
+    def _find_deck(self, index, topic: Optional[str], topic_id: Optional[int]):
+        """Whether the pre-warmed deck covers this topic, plus its cluster id (None for everything) and label"""
+        if index.artifacts.get("decks") is None:
+            return False, None, None
+        if topic is None and topic_id is None:
+            return True, None, "General"
+        cluster = self._find_topic(index, topic, topic_id)
+        if cluster is None:
+            return False, None, None
+        return True, cluster["id"], cluster["name"]
+    
+    def _deal(self, index, tiers: List[List[str]], kind: str, cluster_id: Optional[int], count: int) -> List[Dict]:
+        """Randomly pick items from the deck, exhausting better tiers first.
+        
+        The deck only holds (chunk id, item index) references; picked items
+        are re-mined from their chunk, so a deal costs O(count).
+        """
+        decks = index.artifacts["decks"]
+        picked = []
+        for names in tiers:
+            groups = []
+            for name in names:
+                refs, starts = decks[name]
+                if cluster_id is not None:
+                    refs = refs[starts[cluster_id]:starts[cluster_id + 1]]
+                groups.append(refs)
+            ends = np.cumsum([len(refs) for refs in groups])
+            take = min(int(ends[-1]), count - len(picked))
+            for position in random.sample(range(int(ends[-1])), take):
+                group = int(np.searchsorted(ends, position, side='right'))
+                chunk_id, item = groups[group][position - (int(ends[group - 1]) if group else 0)]
+                picked.append(self._mine_chunk(index.documents[int(chunk_id)]["content"])[kind][int(item)])
+            if len(picked) >= count:
+                break
+        return picked
+    
+    def _prepare_decks(self, segmented):
+        """Unpack the decks artifact and group its references by the current topic clusters.
+        
+        Decks that don't cover every chunk (an upload since they were built)
+        are dropped, so requests fall back to search until the rebuild lands.
+        """
+        decks = segmented.artifacts.get("decks")
+        if not isinstance(decks, dict) or decks.get("chunk_count") != len(segmented.documents):
+            segmented.artifacts.pop("decks", None)
+            return
+        
+        clusters = self._topic_clusters(segmented.artifacts)
+        labels = np.full(len(segmented.documents), -1, dtype='int32')
+        for cluster in clusters:
+            labels[cluster["chunk_ids"]] = cluster["id"]
+        
+        # References sorted by topic, with each topic's slice given by starts
+        prepared = {}
+        for name, packed in decks["tiers"].items():
+            refs = _unpack_refs(packed)
+            ref_labels = labels[refs[:, 0]]
+            order = np.argsort(ref_labels, kind='stable')
+            prepared[name] = (refs[order], np.searchsorted(ref_labels[order], np.arange(len(clusters) + 1)))
+        segmented.artifacts["decks"] = prepared
+    
+    def _schedule_artifact_build(self, index):
+        """Re-cluster topics when due, then pre-warm quiz and flashcard decks, in the background.
+        
+        One build runs at a time. Uploads during a build queue their index,
+        and only the latest queued one is built once the running build ends.
+        """
+        with self._artifact_lock:
+            if self._artifact_building:
+                self._artifact_pending = index
+                return
+            self._artifact_building = True
+        
+        # Builds run outside the store's write lock; a stale one is discarded at commit
+        self._artifact_thread = threading.Thread(target=self._build_artifacts, args=(index,), daemon=True)
+        self._artifact_thread.start()
+    
+    def _build_artifacts(self, index):
+        while index is not None:
+            topics = index.artifacts.get("topics")
+            recluster = (not isinstance(topics, dict)
+                         or len(index.documents) >= TOPIC_RECLUSTER_GROWTH * topics["clustered_count"])
+            try:
+                base = index.generation
+                if recluster:
+                    manifest = self.store.add_artifacts(base, {"topics": self._build_topics})
+                    base = manifest["generation"] if manifest is not None else None
+                # None: superseded by a newer generation, which schedules its own build
+                if base is not None and self.store.add_artifacts(base, {"decks": self._build_decks}) is not None:
+                    print("✓ Quiz and flashcard decks ready")
+            except Exception as e:
+                print(f"Error building topics and decks: {e}")
+            
+            with self._artifact_lock:
+                index, self._artifact_pending = self._artifact_pending, None
+                if index is None:
+                    self._artifact_building = False
+    
+    def _build_decks(self, segmented, previous: Optional[Dict] = None) -> Dict:
+        """Mine quiz questions and flashcards per chunk and sort them into deck tiers.
+        
+        Tiers hold (chunk id, item index) references rather than text. Chunk
+        ids are stable, so references from an earlier build are kept and
+        only chunks added since are mined. Topics are applied when a worker
+        loads the decks, so re-clustering doesn't invalidate them.
+        """
+        n = len(segmented.documents)
+        start = 0
+        tiers = {name: [] for name in QUESTION_TIERS + FLASHCARD_TIERS}
+        if isinstance(previous, dict) and "tiers" in previous and previous["chunk_count"] <= n:
+            start = previous["chunk_count"]
+            for name in tiers:
+                tiers[name].append(_unpack_refs(previous["tiers"][name]))
+        
+        new_refs = {name: [] for name in tiers}
+        seen_questions, seen_cards = set(), set()
+        for chunk_id in range(start, n):
+            mined = self._mine_chunk(segmented.documents[chunk_id]["content"])
+            for i, item in enumerate(mined["questions"]):
+                if item["question"] in seen_questions:
+                    continue  # chunks overlap, so the same line is often mined twice
+                seen_questions.add(item["question"])
+                new_refs[item["difficulty"] if item["mined"] else "explain"].append((chunk_id, i))
+            for i, card in enumerate(mined["flashcards"]):
+                if card["front"] in seen_cards:
+                    continue
+                seen_cards.add(card["front"])
+                new_refs["definition" if card["definition"] else "other"].append((chunk_id, i))
+        
+        packed = {}
+        for name, parts in tiers.items():
+            parts.append(np.array(new_refs[name], dtype='int32').reshape(-1, 2))
+            packed[name] = _pack_refs(np.concatenate(parts))
+        return {"chunk_count": n, "tiers": packed}
+    
+    def _mine_chunk(self, content: str) -> Dict:
+        """Quiz questions and flashcards found in one chunk, using the generators' rules"""
+        questions = []
+        for line in content.split('\n'):
+            line = line.strip()
+            if '?' in line and 20 < len(line) < 200:
+                if EASY_QUESTION_PATTERN.search(line):
+                    difficulty = "easy"
+                elif HARD_QUESTION_PATTERN.search(line):
+                    difficulty = "hard"
+                else:
+                    difficulty = "medium"
+                questions.append({"question": line, "difficulty": difficulty, "mined": True})
+        for sent in content.split('.'):
+            sent = sent.strip()
+            if 20 < len(sent) < 150:
+                questions.append({"question": f"Explain: {sent}?", "difficulty": "medium", "mined": False})
+        
+        flashcards = []
+        for sent in content.split('.'):
+            sent = sent.strip()
+            if not 30 < len(sent) < 200:
+                continue
+            if any(keyword in sent.lower() for keyword in [' is ', ' are ', ' means ', ' refers to ', 'definition']):
+                parts = re.split(r' is | are | means | refers to ', sent, 1, re.IGNORECASE)
+                if len(parts) == 2:
+                    flashcards.append({"front": f"What is {parts[0].strip()}?", "back": parts[1].strip(),
+                                       "definition": True})
+                    continue
+            words = sent.split()
+            if len(words) > 5:
+                flashcards.append({"front": ' '.join(words[:len(words) // 2]) + '...?', "back": sent,
+                                   "definition": False})
+        
+        return {"questions": questions, "flashcards": flashcards}
+    
+    def get_topics(self) -> List[Dict]:
+        """Topic clusters of the current index, largest first"""
+        index = self._ensure_index()
+        return [{key: value for key, value in cluster.items() if key not in ("chunk_ids", "centroid", "source_counts")}
+                for cluster in self._topic_clusters(index.artifacts)]
+    
+    def _topic_clusters(self, artifacts: Dict) -> List[Dict]:
+        """Clusters of a generation's topics artifact"""
+        topics = artifacts.get("topics")
+        return topics["clusters"] if isinstance(topics, dict) else []
+    
+    def _find_topic(self, index, topic: Optional[str], topic_id: Optional[int]) -> Optional[Dict]:
+        """Match a topic id or cluster name against the precomputed clusters"""
+        for cluster in self._topic_clusters(index.artifacts):
+            if topic_id is not None:
+                if cluster["id"] == topic_id:
+                    return cluster
+            elif topic and cluster["name"].lower() == topic.strip().lower():
+                return cluster
+        return None
+    
+    def _topic_documents(self, index, topic: Optional[str], topic_id: Optional[int], k: int,
+                         default_query: str):
+        """Pick chunks for quiz/flashcard generation and the topic label to use"""
+        clusters = self._topic_clusters(index.artifacts)
+        cluster = self._find_topic(index, topic, topic_id)
+        if cluster is not None:
+            # Chunks closest to the cluster centroid come first
+            return [index.documents[idx] for idx in cluster["chunk_ids"][:k]], cluster["name"]
+        if topic_id is not None:
+            raise TopicNotFoundError(f"Topic {topic_id} not found. List the current topics with /topics.")
+        
+        if not topic and clusters:
+            # Cover the largest clusters instead of running a generic search
+            chunk_ids = []
+            for rank in range(k):
+                for c in clusters:
+                    if len(chunk_ids) < k and rank < len(c["chunk_ids"]):
+                        chunk_ids.append(c["chunk_ids"][rank])
+            return [index.documents[idx] for idx in chunk_ids], "General"
+        
+        return self._search(index, topic or default_query, k=k), topic or "General"
+    
+    def _build_topics(self, segmented, previous: Optional[Dict] = None) -> Optional[Dict]:
+        """Cluster chunk embeddings with k-means and name each cluster by its keywords.
+        
+        This reads every chunk, so it runs in the background; uploads only
+        assign their new chunks to the existing clusters (_assign_topics).
+        """
+        try:
+            vectors = np.ascontiguousarray(segmented.reconstruct_all())
+            n = len(vectors)
+            if n == 0:
+                return None
+            
+            num_topics = max(1, min(self.max_topics, int(np.sqrt(n / 2))))
+            kmeans = faiss.Kmeans(vectors.shape[1], num_topics, niter=20, seed=1234,
+                                  spherical=segmented.settings["metric"] == "cosine")
+            kmeans.train(vectors)
+            _, assignments = kmeans.index.search(vectors, 1)
+            assignments = assignments[:, 0]
+            centroid_distances = np.sum((vectors - kmeans.centroids[assignments]) ** 2, axis=1)
+            
+            # Keyword weight: chunks in the cluster using a term, discounted by corpus-wide use
+            chunk_terms = []
+            document_frequency = Counter()
+            for doc in segmented.documents:
+                terms = {t for t in re.findall(r"[a-z][a-z+#]{2,}", doc["content"].lower())
+                         if t not in TOPIC_STOPWORDS}
+                chunk_terms.append(terms)
+                document_frequency.update(terms)
+            
+            clusters = []
+            for label in range(num_topics):
+                members = np.where(assignments == label)[0]
+                if len(members) == 0:
+                    continue
+                members = members[np.argsort(centroid_distances[members], kind='stable')]
+                
+                cluster_frequency = Counter()
+                sources = Counter()
+                for idx in members:
+                    cluster_frequency.update(chunk_terms[idx])
+                    sources[segmented.documents[int(idx)]["source"]] += 1
+                keywords = sorted(cluster_frequency,
+                                  key=lambda t: (-cluster_frequency[t] * np.log(1 + n / document_frequency[t]), t))[:8]
+                
+                clusters.append({
+                    "name": " / ".join(word.capitalize() for word in keywords[:3]) or f"Topic {label + 1}",
+                    "keywords": keywords,
+                    "size": int(len(members)),
+                    "sources": [source for source, _ in sources.most_common(3)],
+                    "source_counts": dict(sources),
+                    "centroid": [round(float(x), 6) for x in kmeans.centroids[label]],
+                    "chunk_ids": [int(idx) for idx in members]
+                })
+            
+            clusters.sort(key=lambda c: -c["size"])
+            seen = Counter()
+            for topic_id, cluster in enumerate(clusters):
+                cluster["id"] = topic_id
+                seen[cluster["name"]] += 1
+                if seen[cluster["name"]] > 1:
+                    cluster["name"] = f"{cluster['name']} ({seen[cluster['name']]})"
+            
+            print(f"✓ Grouped {n} chunks into {len(clusters)} topics")
+            return {"version": uuid.uuid4().hex, "clustered_count": n, "chunk_count": n, "clusters": clusters}
+        except Exception as e:
+            print(f"Error building topic clusters: {e}")
+            return None
+    
+    def _assign_topics(self, segmented, previous: Optional[Dict] = None) -> Optional[Dict]:
+        """Add chunks appended since the last clustering to their nearest cluster.
+        
+        Runs under the store's write lock at upload, so it only touches the
+        new chunks. Ids and names stay put until the next full re-clustering.
+        """
+        if not isinstance(previous, dict) or previous["chunk_count"] > segmented.ntotal:
+            return None  # nothing to extend; the background build clusters from scratch
+        
+        new_ids = np.arange(previous["chunk_count"], segmented.ntotal)
+        clusters = previous["clusters"]
+        if len(new_ids) and clusters:
+            centroids = faiss.IndexFlatL2(len(clusters[0]["centroid"]))
+            centroids.add(np.array([c["centroid"] for c in clusters], dtype='float32'))
+            distances, labels = centroids.search(segmented.reconstruct_ids(new_ids), 1)
+            for position in np.argsort(distances[:, 0], kind='stable'):
+                idx = int(new_ids[position])
+                cluster = clusters[int(labels[position, 0])]
+                cluster["chunk_ids"].append(idx)
+                cluster["size"] += 1
+                source = segmented.documents[idx]["source"]
+                cluster["source_counts"][source] = cluster["source_counts"].get(source, 0) + 1
+            for cluster in clusters:
+                cluster["sources"] = [source for source, _ in Counter(cluster["source_counts"]).most_common(3)]
+        
+        previous["chunk_count"] = segmented.ntotal
+        previous["version"] = uuid.uuid4().hex
+        return previous
+    
     def is_initialized(self) -> bool:
         """Check if document store is initialized"""
-        return len(self.documents) > 0 or os.path.exists(self.docs_path)
+        self._refresh_index()
+        return len(self.documents) > 0 or self._has_legacy_index()
     
     def get_vector_store_size(self) -> int:
         """Get number of documents in store"""
+        self._refresh_index()
         return len(self.documents)
     
     def reset(self):
         """Reset the document store"""
-        self.documents = []
-        self.index = None
-        if os.path.exists(self.docs_path):
-            os.remove(self.docs_path)
-        if os.path.exists(self.index_path):
-            os.remove(self.index_path)
-    
-    def _save_index(self):
-        """Save documents and FAISS index to disk"""
-        if self.documents:
-            # Save documents
-            with open(self.docs_path, 'wb') as f:
-                pickle.dump(self.documents, f)
-            
-            # Save FAISS index
-            if self.index is not None:
-                faiss.write_index(self.index, self.index_path)
+        with self._load_lock:
+            self.documents = []
+            self.index = None
+            self.generation = self.store.clear()["generation"]
+        with self._reference_lock:
+            self.reference_answers.clear()
+        for path in (self.docs_path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def _configured_settings(self) -> Dict:
+        return {"metric": self.metric, "storage": self.vector_storage}
+    
+    def _index_settings(self) -> Dict:
+        """Settings of the loaded index, falling back to the configured ones"""
+        if self.index is not None:
+            return self.index.settings
+        return self._configured_settings()
+    
+    def _build_index(self, embeddings: np.ndarray, settings: Dict):
+        """Create a FAISS index holding the given embeddings"""
+        dimension = embeddings.shape[1]
+        metric = faiss.METRIC_INNER_PRODUCT if settings["metric"] == "cosine" else faiss.METRIC_L2
+        quantizer_type = VECTOR_STORAGE[settings["storage"]]
+        
+        if quantizer_type is None:
+            index = faiss.IndexFlat(dimension, metric)
+        else:
+            # Quantiser ranges are trained per segment on its own vectors
+            index = faiss.IndexScalarQuantizer(dimension, quantizer_type, metric)
+            index.train(embeddings)
+        index.add(embeddings)
+        return index
+    
+    def _source_vectors(self, embeddings: np.ndarray, settings: Dict) -> Optional[np.ndarray]:
+        """fp32 copy stored next to a quantised segment, so compaction doesn't re-quantise"""
+        return None if VECTOR_STORAGE[settings["storage"]] is None else embeddings
+    
+    def migrate_index(self, metric: str, storage: str, reembed: bool = False) -> Dict:
+        """Rebuild the stored index with a new metric and vector storage.
+        
+        Vectors are reconstructed from the current index (normalised when
+        moving to cosine), or re-encoded from the chunk text with reembed,
+        which avoids compounding error from an already quantised index.
+        """
+        if metric not in VECTOR_METRICS or storage not in VECTOR_STORAGE:
+            raise ValueError(f"Unsupported index settings: metric={metric!r}, storage={storage!r}")
+        index = self._ensure_index()
+        
+        settings = {"metric": metric, "storage": storage}
+        documents = list(index.documents)
+        if reembed:
+            vectors = self._embed([doc["content"] for doc in documents], settings, show_progress_bar=True)
+        else:
+            vectors = np.ascontiguousarray(index.reconstruct_all())
+            if metric == "cosine":
+                faiss.normalize_L2(vectors)
+        
+        manifest = self.store.rewrite(self._build_index(vectors, settings), documents, settings,
+                                      source_vectors=self._source_vectors(vectors, settings),
+                                      vector_artifacts=("topics",))
+        if "topics" not in manifest["artifacts"]:
+            # Centroids from the old vector space were dropped; cluster again now
+            self.store.add_artifacts(manifest["generation"], {"topics": self._build_topics})
+        self._load_index()
+        print(f"✓ Migrated {len(documents)} vectors to {metric}/{storage}")
+        return settings
+    
+    def _schedule_compaction(self):
+        """Merge segments in a background thread once too many pile up"""
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+        if not self.store.needs_compaction(self.compact_segments):
+            return
+        
+        def compact():
+            try:
+                self.store.compact(self._build_index)
+            except Exception as e:
+                print(f"Error compacting index: {e}")
+        
+        self._compaction_thread = threading.Thread(target=compact, daemon=True)
+        self._compaction_thread.start()
+    
+    def _ensure_index(self):
+        """Load the latest index generation and return it.
+        
+        Another request may swap self.index at any time, so callers use the
+        returned snapshot (and its documents and artifacts) for the whole request.
+        """
+        index = self.index
+        if index is None or self.store.current_generation() != index.generation:
+            self._load_index()
+            index = self.index
+        if index is None:
+            raise Exception("No vector store available. Please upload documents first.")
+        return index
+    
+    def _refresh_index(self):
+        """Hot-swap to a newer index generation written by another worker"""
+        if self.store.current_generation() != self.generation:
+            self._load_index()
+    
+    def _has_legacy_index(self) -> bool:
+        return os.path.exists(self.index_path) and os.path.exists(self.docs_path)
+    
+    def _migrate_legacy_index(self) -> bool:
+        """Import a faiss_index.bin + documents.pkl pair as the first segment"""
+        if not self._has_legacy_index():
+            return False
+        
+        with open(self.docs_path, 'rb') as f:
+            documents = pickle.load(f)
+        
+        index = faiss.read_index(self.index_path)
+        if self.store.append_segment(index, documents, dict(DEFAULT_SETTINGS), expect_generation=0) is None:
+            return False  # another worker migrated it first
+        for path in (self.docs_path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+        print(f"✓ Migrated {len(documents)} documents to {self.store.root}")
+        return True
     
     def _load_index(self) -> bool:
-        """Load documents and FAISS index from disk"""
-        try:
-            if os.path.exists(self.docs_path) and os.path.exists(self.index_path):
-                # Load documents
-                with open(self.docs_path, 'rb') as f:
-                    self.documents = pickle.load(f)
+        """Load the live index generation from disk"""
+        with self._load_lock:
+            # Requests that queued behind another load find it already done
+            if self.index is not None and self.index.generation == self.store.current_generation():
+                return True
+            
+            try:
+                migrated = self.store.current_generation() == 0 and self._migrate_legacy_index()
+                
+                segmented = self.store.load()
                 
-                # Load FAISS index
-                self.index = faiss.read_index(self.index_path)
+                # Superseded mappings are released once in-flight requests drop them
+                if segmented is None:
+                    # The store is empty or was cleared by another worker
+                    self.documents = []
+                    self.index = None
+                    self.generation = self.store.current_generation()
+                    return False
                 
-                print(f"✓ Loaded {len(self.documents)} documents from disk")
+                self._prepare_decks(segmented)
+                # self.index is swapped last; readers only take snapshots of it
+                self.documents = segmented.documents
+                self.generation = segmented.generation
+                self.index = segmented
+                
+                if segmented.settings != self._configured_settings():
+                    print(f"⚠ Index uses {segmented.settings}, not the configured settings; "
+                          f"run migrate_index.py to convert it")
+                
+                print(f"✓ Loaded {len(segmented.documents)} documents from disk (generation {segmented.generation})")
+                
+                # Old stores had no topic clusters or decks; build them like after an upload
+                if migrated:
+                    self._schedule_artifact_build(segmented)
                 return True
-        except Exception as e:
-            print(f"Error loading index: {e}")
-        return False
+            except Exception as e:
+                print(f"Error loading index: {e}")
+            return False
@@ -0,0 +1,96 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from typing import List, Dict, Optional
+
+import numpy as np
+
+
+class SessionNotFoundError(LookupError):
+    """A session_id this worker doesn't hold: expired, evicted, ended or started on another worker"""
+
+
+class Session:
+    """Recent turns and retrieval state of one conversation.
+
+    Candidate vectors are kept as float16 to halve their footprint; they
+    are only used to rerank the candidate pool on follow-up questions.
+    """
+
+    def __init__(self, session_id: str, max_turns: int):
+        self.id = session_id
+        self.turns = deque(maxlen=max_turns)
+        # Index lineage (data generation and settings) the candidate pool came from
+        self.lineage = None
+        self.candidate_ids = np.zeros(0, dtype='int64')
+        self.candidate_vectors = None
+        self.query_vector = None
+        self.last_used = time.time()
+
+    def history(self) -> List[Dict]:
+        return list(self.turns)
+
+    def add_turn(self, question: str, answer: str, prompt: Optional[str] = None, subject: Optional[str] = None):
+        """Record a turn; prompt is the rewritten question, subject the standalone one it builds on"""
+        self.turns.append({"question": question, "answer": answer,
+                           "prompt": prompt or question, "subject": subject or question})
+
+    def set_candidates(self, lineage: tuple, ids: np.ndarray, vectors: np.ndarray, query_vector: np.ndarray):
+        self.lineage = lineage
+        self.candidate_ids = np.asarray(ids, dtype='int64')
+        self.candidate_vectors = np.asarray(vectors, dtype='float16')
+        self.query_vector = np.asarray(query_vector, dtype='float16')
+
+    def clear_candidates(self):
+        self.lineage = None
+        self.candidate_ids = np.zeros(0, dtype='int64')
+        self.candidate_vectors = None
+        self.query_vector = None
+
+
+class SessionStore:
+    """In-memory conversation sessions with LRU eviction.
+
+    Memory stays bounded at roughly max_sessions x (max_turns of text +
+    max_candidates x dimension x 2 bytes). Sessions live in one worker
+    process; a request routed to another worker gets SessionNotFoundError.
+    """
+
+    def __init__(self, max_sessions: int = 2000, max_turns: int = 6):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Session:
+        """The session with this id, or a new one when session_id is None.
+
+        An unknown id raises SessionNotFoundError instead of silently
+        starting an empty conversation under it.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                if session_id:
+                    raise SessionNotFoundError(f"Session {session_id} not found. Start a new conversation "
+                                               f"without session_id.")
+                session = Session(uuid.uuid4().hex, self.max_turns)
+                self._sessions[session.id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session.id)
+            session.last_used = time.time()
+            return session
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
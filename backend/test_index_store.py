@@ -0,0 +1,195 @@
+"""
+IndexStore: commits, compaction and garbage collection on a temp directory.
+
+Run from the backend directory:
+    python -m pytest test_index_store.py
+"""
+import json
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from index_store import IndexStore
+
+SETTINGS = {"metric": "l2", "storage": "fp32"}
+DIMENSION = 8
+
+
+@pytest.fixture
+def store(tmp_path):
+    return IndexStore(str(tmp_path / "index"))
+
+
+def make_segment(start: int, count: int):
+    """A flat index plus matching chunks; chunk i carries the text f"chunk {i}" """
+    vectors = np.random.RandomState(start).rand(count, DIMENSION).astype('float32')
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors)
+    documents = [{"content": f"chunk {start + i}", "source": "notes.pdf", "page": 1, "chunk": i}
+                 for i in range(count)]
+    return index, documents, vectors
+
+
+def flat_factory(vectors, settings):
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+def live_files(store):
+    """Files named by the live manifest, including itself"""
+    manifest = store.read_manifest()
+    names = {f"MANIFEST-{manifest['generation']:06d}.json"}
+    names.update(f for s in manifest["segments"] for f in s["files"].values())
+    names.update(manifest["artifacts"].values())
+    return names
+
+
+def test_append_and_load_round_trip(store):
+    first, first_docs, first_vectors = make_segment(0, 3)
+    second, second_docs, second_vectors = make_segment(3, 2)
+    store.append_segment(first, first_docs, SETTINGS)
+    manifest = store.append_segment(second, second_docs, SETTINGS)
+
+    segmented = store.load()
+
+    assert segmented.generation == manifest["generation"] == 2
+    assert segmented.settings == SETTINGS
+    assert list(segmented.documents) == first_docs + second_docs
+    np.testing.assert_array_equal(segmented.reconstruct_all(), np.vstack([first_vectors, second_vectors]))
+    # Ids are global across segments
+    _, ids = segmented.search(second_vectors[:1], 1)
+    assert ids[0, 0] == 3
+
+
+def test_stale_expect_generation_writes_nothing(store):
+    index, documents, _ = make_segment(0, 3)
+    store.append_segment(index, documents, SETTINGS)
+    files_before = set(os.listdir(store.root))
+
+    index, documents, _ = make_segment(3, 3)
+    result = store.append_segment(index, documents, SETTINGS, expect_generation=0)
+
+    assert result is None
+    assert store.current_generation() == 1
+    assert set(os.listdir(store.root)) == files_before
+
+
+def test_compaction_keeps_chunk_order(store):
+    expected_docs, expected_vectors = [], []
+    for start in (0, 3, 6):
+        index, documents, vectors = make_segment(start, 3)
+        store.append_segment(index, documents, SETTINGS)
+        expected_docs += documents
+        expected_vectors.append(vectors)
+
+    assert store.compact(flat_factory)
+
+    manifest = store.read_manifest()
+    segmented = store.load()
+    assert len(manifest["segments"]) == 1
+    assert list(segmented.documents) == expected_docs
+    np.testing.assert_array_equal(segmented.reconstruct_all(), np.vstack(expected_vectors))
+
+
+def test_upload_during_compaction_is_kept(store):
+    for start in (0, 3):
+        index, documents, _ = make_segment(start, 3)
+        store.append_segment(index, documents, SETTINGS)
+
+    def factory_with_upload(vectors, settings):
+        # The merge is built without the write lock, so an upload can land meanwhile
+        index, documents, _ = make_segment(6, 2)
+        assert store.append_segment(index, documents, SETTINGS) is not None
+        return flat_factory(vectors, settings)
+
+    assert store.compact(factory_with_upload)
+
+    segmented = store.load()
+    assert [s["count"] for s in store.read_manifest()["segments"]] == [6, 2]
+    assert [doc["content"] for doc in segmented.documents] == [f"chunk {i}" for i in range(8)]
+
+
+def test_compaction_quantises_source_vectors_once(store):
+    settings = {"metric": "l2", "storage": "sq8"}
+
+    def sq8_factory(vectors, settings):
+        index = faiss.IndexScalarQuantizer(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit)
+        index.train(vectors)
+        index.add(vectors)
+        return index
+
+    all_vectors = []
+    for _ in range(3):
+        for start in range(0, 9, 3):
+            _, documents, vectors = make_segment(start + 10 * len(all_vectors), 3)
+            store.append_segment(sq8_factory(vectors, settings), documents, settings, source_vectors=vectors)
+            all_vectors.append(vectors)
+        assert store.compact(sq8_factory)
+
+    # Repeated compactions match a single quantisation of the original vectors
+    vectors = np.vstack(all_vectors)
+    np.testing.assert_array_equal(store.load().reconstruct_all(),
+                                  sq8_factory(vectors, settings).reconstruct_n(0, len(vectors)))
+
+
+def test_garbage_collection_keeps_live_files(store):
+    for start in range(0, 12, 3):
+        index, documents, _ = make_segment(start, 3)
+        store.append_segment(index, documents, SETTINGS)
+    store.add_artifacts(store.current_generation(), {"topics": lambda segmented, previous: {"clusters": []}})
+    store.compact(flat_factory)
+    index, documents, _ = make_segment(12, 3)
+    store.append_segment(index, documents, SETTINGS)
+
+    store.collect_garbage()
+
+    names = set(os.listdir(store.root))
+    assert live_files(store) <= names
+    # Only the last two manifests survive, and only segments they name
+    manifests = sorted(name for name in names if name.startswith("MANIFEST-"))
+    assert len(manifests) == 2
+    kept_segments = set()
+    for name in manifests:
+        with open(os.path.join(store.root, name)) as f:
+            kept_segments.update(f for s in json.load(f)["segments"] for f in s["files"].values())
+    assert {name for name in names if name.startswith("seg-")} == kept_segments
+    assert store.load().ntotal == 15
+
+
+def test_references_outlive_artifact_and_compaction_commits(store):
+    for start in (0, 3):
+        index, documents, _ = make_segment(start, 3)
+        store.append_segment(index, documents, SETTINGS)
+    data_generation = store.load().data_generation
+    store.write_reference(data_generation, "What is paging?", {"answer": "Fixed-size pages", "source_ids": [0]})
+
+    for _ in range(3):
+        store.add_artifacts(store.current_generation(), {"topics": lambda segmented, previous: {"clusters": []}})
+    store.compact(flat_factory)
+    store.collect_garbage()
+
+    assert store.load().data_generation == data_generation
+    assert store.read_reference(data_generation, "What is paging?")["answer"] == "Fixed-size pages"
+
+    # New chunks start a new data generation, and the old references are collected
+    index, documents, _ = make_segment(6, 3)
+    store.append_segment(index, documents, SETTINGS)
+    store.add_artifacts(store.current_generation(), {"topics": lambda segmented, previous: {"clusters": []}})
+    assert store.load().data_generation != data_generation
+    assert store.read_reference(data_generation, "What is paging?") is None
+
+
+def test_rewrite_drops_vector_artifacts_when_settings_change(store):
+    index, documents, vectors = make_segment(0, 3)
+    store.append_segment(index, documents, SETTINGS)
+    store.add_artifacts(1, {"topics": lambda segmented, previous: {"clusters": []},
+                            "decks": lambda segmented, previous: {"chunk_count": 3}})
+
+    cosine = {"metric": "cosine", "storage": "fp32"}
+    manifest = store.rewrite(flat_factory(vectors, cosine), documents, cosine, vector_artifacts=("topics",))
+
+    assert set(manifest["artifacts"]) == {"decks"}
+    assert store.load().artifacts == {"decks": {"chunk_count": 3}}
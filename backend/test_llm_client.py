@@ -0,0 +1,96 @@
+"""
+LLMClient against fake_openai_server.py: retries and the extractive fallback.
+
+Run from the backend directory:
+    python -m pytest test_llm_client.py
+"""
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from fake_openai_server import make_handler
+from llm_client import LLMClient
+
+MESSAGES = [{"role": "user", "content": "Context:\nnone\n\nQuestion: What is a deadlock?\n\nAnswer briefly."}]
+
+
+@pytest.fixture
+def fake_server():
+    """Start a fake OpenAI server; yields a factory taking make_handler's options"""
+    servers = []
+
+    def start(**options):
+        handler = make_handler(options.get("delay", 0.0), options.get("error_rate", 0.0),
+                               options.get("fail_first", 0))
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/v1", handler.stats
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(base_url: str, **options) -> LLMClient:
+    settings = {"timeout": 2.0, "latency_budget": 5.0, "rate_limit": 100.0, "burst": 100, "max_retries": 2}
+    settings.update(options)
+    return LLMClient(api_key="test", base_url=base_url, **settings)
+
+
+def test_answer_from_server(fake_server):
+    base_url, stats = fake_server()
+    client = make_client(base_url)
+
+    answer = client.complete(MESSAGES, fallback=lambda: "extractive")
+
+    assert answer == "Fake answer to: What is a deadlock?"
+    assert stats["requests"] == 1
+
+
+def test_server_errors_are_retried(fake_server):
+    base_url, stats = fake_server(fail_first=2)
+    client = make_client(base_url, max_retries=2)
+
+    answer = client.complete(MESSAGES, fallback=lambda: "extractive")
+
+    assert answer == "Fake answer to: What is a deadlock?"
+    assert stats["requests"] == 3
+
+
+def test_falls_back_when_retries_run_out(fake_server):
+    base_url, stats = fake_server(fail_first=10)
+    client = make_client(base_url, max_retries=1)
+
+    answer = client.complete(MESSAGES, fallback=lambda: "extractive")
+
+    assert answer == "extractive"
+    assert stats["requests"] == 2
+
+
+def test_slow_server_falls_back_within_latency_budget(fake_server):
+    base_url, _ = fake_server(delay=3.0)
+    client = make_client(base_url, timeout=0.5, latency_budget=1.0)
+
+    start = time.monotonic()
+    answer = client.complete(MESSAGES, fallback=lambda: "extractive")
+
+    assert answer == "extractive"
+    assert time.monotonic() - start < 2.0
+
+
+def test_complete_many_falls_back_per_request(fake_server):
+    base_url, _ = fake_server(fail_first=1)
+    client = make_client(base_url, max_retries=0)
+
+    answers = client.complete_many([
+        {"messages": MESSAGES, "fallback": lambda: "first"},
+        {"messages": MESSAGES, "fallback": lambda: "second"},
+    ])
+
+    # Only the request that hit the injected failure uses its own fallback
+    assert "Fake answer to: What is a deadlock?" in answers
+    assert len({"first", "second"} & set(answers)) == 1
@@ -15,6 +15,7 @@ function App() {
   const [currentMode, setCurrentMode] = useState('general');
   const [selectedCompany, setSelectedCompany] = useState('');
   const [selectedTopic, setSelectedTopic] = useState('');
+  const [documentTopics, setDocumentTopics] = useState([]);
 
   useEffect(() => {
     checkServerHealth();
@@ -37,11 +38,22 @@ function App() {
       const response = await fetch('http://localhost:8000/documents');
       const data = await response.json();
       setDocuments(data.documents || []);
+      await fetchTopics();
     } catch (error) {
       console.error('Error fetching documents:', error);
     }
   };
 
+  const fetchTopics = async () => {
+    try {
+      const response = await fetch('http://localhost:8000/topics');
+      const data = await response.json();
+      setDocumentTopics(data.topics || []);
+    } catch (error) {
+      console.error('Error fetching topics:', error);
+    }
+  };
+
   const handleFilesUpload = async (files) => {
     setIsUploading(true);
     const formData = new FormData();
@@ -108,6 +120,7 @@ function App() {
             onCompanyChange={setSelectedCompany}
             selectedTopic={selectedTopic}
             onTopicChange={setSelectedTopic}
+            documentTopics={documentTopics}
           />
         )}
 
@@ -7,6 +7,7 @@ function ChatInterface({ mode, company, topic, onUploadMore, isUploading }) {
   const [messages, setMessages] = useState([]);
   const [inputValue, setInputValue] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [sessionId, setSessionId] = useState(null);
   const messagesEndRef = useRef(null);
   const fileInputRef = useRef(null);
 
@@ -31,6 +32,11 @@ function ChatInterface({ mode, company, topic, onUploadMore, isUploading }) {
     }
   }, [mode]);
 
+  useEffect(() => {
+    // Start a fresh conversation when the mode changes
+    setSessionId(null);
+  }, [mode]);
+
   const getModeWelcomeMessage = () => {
     switch (mode) {
       case 'mock_interview':
@@ -57,21 +63,32 @@ function ChatInterface({ mode, company, topic, onUploadMore, isUploading }) {
     setInputValue('');
     setIsLoading(true);
 
+    const sendQuery = (session) => fetch('http://localhost:8000/query', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        question: inputValue,
+        mode: mode,
+        company: company || null,
+        topic: topic || null,
+        session_id: session
+      }),
+    });
+
     try {
-      const response = await fetch('http://localhost:8000/query', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          question: inputValue,
-          mode: mode,
-          company: company || null,
-          topic: topic || null
-        }),
-      });
+      let response = await sendQuery(sessionId);
+      if (response.status === 404 && sessionId) {
+        // The server no longer knows this conversation; start a new one
+        setSessionId(null);
+        response = await sendQuery(null);
+      }
 
       const data = await response.json();
+      if (data.session_id) {
+        setSessionId(data.session_id);
+      }
 
       const aiMessage = {
         type: 'ai',
@@ -10,7 +10,8 @@ function Sidebar({
   selectedCompany,
   onCompanyChange,
   selectedTopic,
-  onTopicChange
+  onTopicChange,
+  documentTopics = []
 }) {
   const modes = [
     { id: 'general', label: 'General Chat', icon: <FiMessageCircle /> },
@@ -98,11 +99,22 @@ function Sidebar({
           className="topic-select"
         >
           <option value="">All Topics</option>
-          {topics.map((topic) => (
-            <option key={topic} value={topic}>
-              {topic}
-            </option>
-          ))}
+          {documentTopics.length > 0 && (
+            <optgroup label="From your documents">
+              {documentTopics.map((topic) => (
+                <option key={`doc-${topic.id}`} value={topic.name}>
+                  {topic.name} ({topic.size})
+                </option>
+              ))}
+            </optgroup>
+          )}
+          <optgroup label="Common topics">
+            {topics.map((topic) => (
+              <option key={topic} value={topic}>
+                {topic}
+              </option>
+            ))}
+          </optgroup>
         </select>
       </div>
 